@@ -0,0 +1,41 @@
+import logging
+import os
+import threading
+from io import BytesIO
+
+from discord import File
+
+from My24HS_Bot.cache import LRUCache
+from My24HS_Bot.const import attachment_cache_size, attachment_cache_entries
+
+
+class AttachmentStore:
+    def __init__(self, max_size: int = attachment_cache_size, max_entries: int = attachment_cache_entries):
+        self.logger = logging.getLogger('AttachmentStore')
+        # Path -> file contents. Rarely used attachments get evicted once we go over the memory budget
+        self.blobs = LRUCache(max_entries=max_entries, max_size=max_size, sizeof=len)
+        # Commands are reloaded (and attachments invalidated) in a thread, while they're used on the event loop
+        self.lock = threading.Lock()
+
+    def load(self, path: str) -> bytes:
+        with self.lock:
+            blob = self.blobs.get(path)
+        if blob is None:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            self.logger.debug('Loaded {} ({} bytes)'.format(path, len(blob)))
+            with self.lock:
+                self.blobs.put(path, blob)
+        return blob
+
+    def open(self, path: str) -> File:
+        # A BytesIO created from bytes shares their buffer until it's written to, so no copy is made here. File
+        # objects are single use though, so we still need a new one every time
+        return File(fp=BytesIO(self.load(path)), filename=os.path.basename(path))
+
+    def invalidate(self, path: str = None):
+        with self.lock:
+            if path is None:
+                self.blobs.clear()
+            else:
+                self.blobs.pop(path)
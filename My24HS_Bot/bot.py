@@ -1,33 +1,160 @@
 import asyncio
 import logging
 import os
+import time
 import traceback
-from io import StringIO
+from io import BytesIO
 from typing import Union
 
+import aiohttp
 import discord
 import discord_slash
-import yaml
-from discord import File, Message, Member, Guild, Embed, Activity, ActivityType, User
-from discord.ext.commands import Bot
+from discord import File, Message, Member, Guild, Embed, Activity, ActivityType, User, Intents, MemberCacheFlags
+from discord.ext.commands import Bot, AutoShardedBot
 from discord_slash import ButtonStyle, ComponentContext, SlashContext
 from discord_slash.utils.manage_commands import create_option
-from discord_slash.utils.manage_components import create_button, create_actionrow, wait_for_component
-
-from My24HS_Bot.const import commands_dir, sysinfo_allowed_roles, embed_color, attachments_dir, edit_mention
-from My24HS_Bot.util import handle_sysinfo, download_sysinfo
+from discord_slash.utils.manage_components import create_button, create_actionrow
+
+from My24HS_Bot import metrics
+from My24HS_Bot.cache import SysinfoCache, CachedSysinfo
+from My24HS_Bot.command_registry import CommandRegistry, CommandResponse, CommandChanges
+from My24HS_Bot.const import lean_gateway, guild_ready_timeout, edit_mention, command_reload_interval, metrics_mode, \
+    metrics_port, prompt_timeout, prompt_spill_dir, diagnosis_db_path, shared_cache_path, version_cache_dir, embed_color
+from My24HS_Bot.diagnosis_store import DiagnosisStore, DiagnosisQuery, Diagnosis
+from My24HS_Bot.export import export_sysinfo
+from My24HS_Bot.executor import ParseExecutor, ExecutorBusy
+from My24HS_Bot.prefilter import SysinfoPrefilter
+from My24HS_Bot.prompts import PromptRegistry, PendingPrompt, spill_file, remove_spilled_file
+from My24HS_Bot.registration import CommandRegistrar
+from My24HS_Bot.responses import Response, ChannelSender
+from My24HS_Bot.roles import MemberRoles, allowed_roles
+from My24HS_Bot.shared_cache import SharedSysinfoCache
+from My24HS_Bot.sharding import ShardPlan
+from My24HS_Bot.startup import StartupTimer
+from My24HS_Bot.util import handle_sysinfo, download_sysinfo, sysinfo_embeds, SysinfoFile
+from My24HS_Bot.version_feeds import VersionFeedService, get_version_tables
+
+# Every command has the same options
+command_options = [
+    create_option(
+        name='noinline',
+        description='Disable inline links in message',
+        option_type=5,
+        required=False
+    ),
+    create_option(
+        name='mention',
+        description='Specify a user to ping with the command',
+        option_type=6,
+        required=False
+    )
+]
+
+
+diagnoses_description = 'Search sysinfo files that were parsed before'
+diagnoses_options = [
+    create_option(name='user', description='Only files sent by this user', option_type=6, required=False),
+    create_option(name='gpu', description='Only files with a GPU containing this, like "GTX 1060"', option_type=3,
+                  required=False),
+    create_option(name='driver', description='Only files with this GPU driver version', option_type=3, required=False),
+    create_option(name='build', description='Only files with this Windows build', option_type=4, required=False),
+    create_option(name='outdated_gpu', description='Only files with (or without) an outdated GPU driver',
+                  option_type=5, required=False),
+    create_option(name='outdated_windows', description='Only files with (or without) an outdated Windows version',
+                  option_type=5, required=False),
+    create_option(name='days', description='Only files from the last few days', option_type=4, required=False)
+]
 
 
 # Python doesn't allow classes to start with a number, so we have to add a "My" to the start of this
 class My24HSbot(Bot):
-    def __init__(self, **options):
-        super().__init__(**options)
+    def __init__(self, shard_plan: ShardPlan = ShardPlan(), startup: StartupTimer = None, **options):
+        super().__init__(**shard_plan.bot_options(), **options)
+        self.startup = startup or StartupTimer()
+        # Which shards this process runs. Everything here (commands, prompts...) only ever sees guilds on those shards
+        self.shard_plan = shard_plan
         self.shash_handler = discord_slash.SlashCommand(self)
         self.logger = logging.getLogger('24HS-Bot')
-        self.commands_list: dict = {}
+        # All commands are compiled once when they're read in, so responding to one is just a lookup
+        self.command_registry = CommandRegistry()
+        self.commands_read: Union[asyncio.Future, None] = None
+        # Keeps track of which guilds have which commands registered, and only pushes them where necessary
+        self.registrar = CommandRegistrar(self.shash_handler)
         self.has_added_commands = False
+        # Used for everything that isn't the Discord API itself (downloading sysinfo files, for example)
+        self.http_session: Union[aiohttp.ClientSession, None] = None
+        self.version_feeds: Union[VersionFeedService, None] = None
+        self.metrics_server: Union[metrics.MetricsServer, None] = None
+        metrics.sysinfo_queue_depth.callback = lambda: self.executor.queued
+        metrics.sysinfo_cache_hit_ratio.callback = lambda: metrics.hit_ratio(
+            self.sysinfo_cache.hits, self.sysinfo_cache.misses
+        )
+        metrics.attachment_cache_hit_ratio.callback = lambda: metrics.hit_ratio(
+            self.command_registry.attachment_store.blobs.hits, self.command_registry.attachment_store.blobs.misses
+        )
+        # Decoding and parsing sysinfo files is done in here, so the event loop doesn't get blocked
+        self.executor = ParseExecutor()
+        self.prefilter = SysinfoPrefilter()
+        self.sysinfo_cache = SysinfoCache()
+        self.shared_cache: Union[SharedSysinfoCache, None] = None
+        # Sysinfo prompts that haven't been answered yet
+        self.prompts = PromptRegistry(
+            spill_dir=os.path.join(prompt_spill_dir, shard_plan.name) if shard_plan.sharded else prompt_spill_dir
+        )
+        self.diagnosis_store: Union[DiagnosisStore, None] = None
+        # Sends everything that doesn't answer an interaction, one message per response where possible
+        self.sender = ChannelSender(self.http)
+        self.member_roles = MemberRoles(self.http)
+
+    async def start(self, *args, **kwargs):
+        # Reading the commands doesn't need Discord, so it happens in the background while we're connecting
+        self.commands_read = asyncio.get_running_loop().run_in_executor(None, self.read_commands)
+        self.http_session = aiohttp.ClientSession()
+        self.version_feeds = VersionFeedService(self.http_session, cache_dir=version_cache_dir)
+        with self.startup.phase('version feeds'):
+            await self.version_feeds.start()
+        with self.startup.phase('storage'):
+            if diagnosis_db_path:
+                self.diagnosis_store = DiagnosisStore()
+                await self.diagnosis_store.start()
+            if shared_cache_path:
+                self.shared_cache = SharedSysinfoCache()
+                await self.shared_cache.start()
+        if metrics_mode != 'off':
+            # Worker processes can't all listen on the same port
+            self.metrics_server = metrics.MetricsServer(port=metrics_port + self.shard_plan.first_shard)
+            await self.metrics_server.start()
+        await super().start(*args, **kwargs)
+
+    async def login(self, *args, **kwargs):
+        with self.startup.phase('login'):
+            await super().login(*args, **kwargs)
+        # Connecting and receiving every guild, until on_ready
+        self.startup.begin('gateway')
+
+    def read_commands(self):
+        # Runs in a thread
+        with self.startup.phase('commands'):
+            self.command_registry.read_commands()
+
+    async def close(self):
+        await super().close()
+        await self.registrar.stop()
+        self.prompts.clear()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.version_feeds:
+            await self.version_feeds.stop()
+        if self.diagnosis_store:
+            await self.diagnosis_store.stop()
+        if self.shared_cache:
+            await self.shared_cache.stop()
+        if self.http_session:
+            await self.http_session.close()
+        self.executor.shutdown()
 
     async def on_ready(self):
+        self.startup.end('gateway')
         await self.change_presence(activity=Activity(name='DanielIsCool.txt', type=ActivityType.watching))
         # on_ready is called when the bot starts and when it reconnects. Thus, we can't just add the commands
         # every time we're in here, since that will error out with duplicate command warnings
@@ -36,15 +163,29 @@ class My24HSbot(Bot):
         # Add and sync slash commands
         await self.add_commands()
         self.logger.info('on_ready finished, logged in as {}'.format(self.user))
+        self.startup.finish()
         self.has_added_commands = True
+        if command_reload_interval:
+            self.loop.create_task(self.watch_commands())
+
+    async def on_shard_ready(self, shard_id: int):
+        # Only sent when sharded. A shard that had to start a new session might be in guilds we haven't synced yet,
+        # the initial sync is done by on_ready
+        if self.has_added_commands:
+            self.registrar.schedule(guild.id for guild in self.guilds if guild.shard_id == shard_id)
+
+    async def on_guild_available(self, guild: Guild):
+        # Guilds that only showed up after on_ready (see guild_ready_timeout) or became available again
+        if self.has_added_commands:
+            self.registrar.schedule([guild.id])
 
     async def on_guild_join(self, guild: Guild):
         self.logger.info('Joined a guild! {}'.format(guild.name))
-        await self.add_commands([guild.id])
+        self.registrar.schedule([guild.id])
 
     async def on_guild_remove(self, guild: Guild):
         self.logger.info('Left a guild! {}'.format(guild.name))
-        await self.add_commands([guild.id])
+        self.registrar.forget(guild.id)
 
     async def on_message(self, message: discord.Message):
         if not self.is_interesting_message(message):
@@ -54,25 +195,38 @@ class My24HSbot(Bot):
         # here should be fine
         sysinfo_attachment = message.attachments[0]
 
-        # For some reason some attachment files can just not have a file name?
-        if not sysinfo_attachment.filename:
-            return
-
-        # Ignore non-text attachments and text attachments that aren't UTF-16
-        if not sysinfo_attachment.filename.endswith('.txt') and not sysinfo_attachment.content_type.endswith('UTF-16'):
+        # Everything that can be decided without downloading anything is checked first
+        rejected_because = self.prefilter.check(message, sysinfo_attachment)
+        if rejected_because:
+            metrics.sysinfo_files.inc(rejected_because)
+            if rejected_because == 'rate_limited':
+                self.logger.info('Ignoring possible sysinfo file in #{} (sent by {}), rate limit reached'.format(
+                    message.channel, message.author
+                ))
             return
 
         self.logger.debug('Got a UTF-16 encoded text file. This might be a sysinfo!')
-        utf8_sysinfo_or_false = await download_sysinfo(sysinfo_attachment)
-        if not utf8_sysinfo_or_false:
+        try:
+            async with self.executor.reserve():
+                with metrics.sysinfo_download_seconds.time():
+                    sysinfo_or_false = await download_sysinfo(sysinfo_attachment, self.http_session, self.executor)
+        except ExecutorBusy:
+            metrics.sysinfo_files.inc('busy')
+            self.logger.warning('Too many sysinfo files are being processed, ignoring file in #{}'.format(
+                message.channel
+            ))
+            return
+        if not sysinfo_or_false:
+            metrics.sysinfo_files.inc('not_sysinfo')
             self.logger.debug('Text file turned out to not be a sysinfo file.')
             return
+        metrics.sysinfo_files.inc('sysinfo')
 
         filename_without_extension = '.'.join(sysinfo_attachment.filename.split('.')[:-1])
         new_filename = filename_without_extension + '_utf8.txt'
-        await self.handle_sysinfo(utf8_sysinfo_or_false, message, new_filename)
+        await self.handle_sysinfo(sysinfo_or_false, message, new_filename)
 
-    async def handle_sysinfo(self, utf8_sysinfo: StringIO, message, filename: str):
+    async def handle_sysinfo(self, sysinfo: SysinfoFile, message, filename: str):
         self.logger.info(
             'Asking if sysinfo file in #{} (sent by {}) should be parsed'.format(message.channel, message.author)
         )
@@ -81,191 +235,234 @@ class My24HSbot(Bot):
             create_button(label='No', style=ButtonStyle.red)
         )
         msg: Message
-        msg = await message.channel.send(
-            content='A sysinfo file was detected! Do you want to run QuickDiagnose?\n\n'
-                    'Note: Only tech support can press the buttons',
-            components=[action_row]
+        with metrics.discord_send_seconds.time('sysinfo_prompt'):
+            msg = await message.channel.send(
+                content='A sysinfo file was detected! Do you want to run QuickDiagnose?\n\n'
+                        'Note: Only tech support can press the buttons',
+                components=[action_row]
+            )
+        # From here on, the prompt is only answered through on_component (the buttons work as soon as it's sent).
+        # Until then, we only keep the message IDs around (and the file, which gets moved to disk if it's big)
+        prompt = PendingPrompt(
+            prompt_message_id=msg.id,
+            source_message_id=message.id,
+            channel_id=message.channel.id,
+            guild_id=message.guild.id if message.guild else None,
+            author_id=message.author.id,
+            description='#{} (sent by {})'.format(message.channel, message.author),
+            filename=filename,
+            digest=sysinfo.digest
         )
+        prompt.keep_file(sysinfo.utf8)
+        prompt.timeout_handle = self.loop.call_later(prompt_timeout, self.expire_prompt, prompt.prompt_message_id)
+        for evicted in self.prompts.add(prompt):
+            metrics.sysinfo_prompts.inc('evicted')
+            self.loop.create_task(self.delete_prompt(evicted))
+
+        # Files can be up to 64 MB, writing them to disk mustn't block everything else. Until it's done, the prompt
+        # keeps (and can be answered with) the copy in memory
         try:
-            interaction: ComponentContext = await wait_for_component(
-                self,
-                components=action_row,
-                timeout=600,
-                check=button_check
-            )
-        except asyncio.TimeoutError:
-            await msg.delete()
+            spill_path = await self.executor.run_in_thread(spill_file, sysinfo.utf8, self.prompts.spill_dir)
+        except OSError as e:
+            self.logger.warning('Failed to move sysinfo file in {} to disk: {}'.format(prompt.description, e))
+            if self.prompts.remove(prompt.prompt_message_id) is not None:
+                prompt.discard_file()
+                await self.delete_prompt(prompt)
+            return
+        if spill_path is None:
+            return
+        if self.prompts.prompts.get(prompt.prompt_message_id) is prompt:
+            prompt.file_spilled(spill_path)
+        else:
+            # Answered (or dropped) while the file was being written
+            remove_spilled_file(spill_path)
+
+    async def on_component(self, interaction: ComponentContext):
+        prompt = self.prompts.prompts.get(interaction.origin_message_id)
+        if prompt is None or not await self.is_tech_support(interaction):
+            return
+        # Checking the roles might have taken a request, in the meantime someone else could've answered the prompt
+        if self.prompts.remove(prompt.prompt_message_id) is None:
             return
+        metrics.sysinfo_prompt_wait_seconds.observe(self.loop.time() - prompt.created)
 
         if interaction.component['label'] == 'No':
-            await msg.delete()
+            metrics.sysinfo_prompts.inc('declined')
+            prompt.discard_file()
+            await self.delete_prompt(prompt)
             return
 
         await interaction.edit_origin(
             content='Parsing Sysinfo...',
             components=None
         )
+        await self.parse_sysinfo(prompt, interaction.channel)
 
-        async with interaction.channel.typing():
-            try:
-                info, quickdiagnosis = handle_sysinfo(utf8_sysinfo)
-            except Exception as e:
-                await message.channel.send(
-                    content='There was an issue parsing this sysinfo file \\:( \n```\n' +
-                            ''.join(traceback.format_exception(type(e), e, e.__traceback__)) + '```',
-                    delete_after=30.0
-                )
-                await msg.delete()
-                self.logger.info(
-                    'Failed to parse sysinfo file: \n' +
-                    ''.join(traceback.format_exception(type(e), e, e.__traceback__))
-                )
-                return
-            await message.channel.send(
-                embed=info
-            )
-            if quickdiagnosis.description != '':
-                await message.channel.send(
-                    embed=quickdiagnosis
-                )
-            # Check if the file size is more than 8MB
-            utf8_sysinfo.seek(0, os.SEEK_END)
-            if utf8_sysinfo.tell() <= 8000000:
-                utf8_sysinfo.seek(0)
-                await message.channel.send(
-                    content='Sysinfo file in UTF-8 encoding:',
-                    file=File(fp=utf8_sysinfo, filename=filename)
-                )
-        self.logger.info('Parsed sysinfo file in #{} (sent by {})'.format(message.channel, message.author))
-        await msg.delete()
-
-    def read_commands(self):
-        for file_or_folder in os.listdir(commands_dir):
-            if not os.path.isfile(os.path.join(commands_dir, file_or_folder)):
-                continue
-
-            filename, fileext = os.path.splitext(file_or_folder)
-            if fileext != '.yml':
-                continue
-
-            with open(os.path.join(commands_dir, file_or_folder)) as f:
-                self.commands_list[filename] = yaml.safe_load(f)
-
-    async def add_commands(self, guilds: list[Guild] = None):
-        # If specific guilds aren't specified, use all guilds
-        if guilds is None:
-            guilds = self.guilds
-
-        guild_ids = list(guild.id for guild in guilds)
-        # If we don't have commands stored yet, read them in
-        if not self.commands_list:
-            self.read_commands()
-
-        for command_name, command_info in self.commands_list.items():
-            # If the command is a copy, replace all the info (description etc.) with the original one's
-            if command_info.get('copy_of'):
-                self.logger.debug('Command {} is a copy of {}'.format(command_name, command_info.get('copy_of')))
-                command_info = self.commands_list[command_info.get('copy_of')]
+    def expire_prompt(self, prompt_message_id: int):
+        prompt = self.prompts.remove(prompt_message_id)
+        if prompt is None:
+            return
+        metrics.sysinfo_prompt_wait_seconds.observe(self.loop.time() - prompt.created)
+        metrics.sysinfo_prompts.inc('timeout')
+        prompt.discard_file()
+        self.loop.create_task(self.delete_prompt(prompt))
+
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        # If either the sysinfo file or our prompt got deleted, nobody can answer the prompt anymore
+        prompt = self.prompts.remove_by_source(payload.message_id)
+        if prompt is not None:
+            metrics.sysinfo_prompts.inc('deleted')
+            prompt.discard_file()
+            await self.delete_prompt(prompt)
+            return
+        prompt = self.prompts.remove(payload.message_id)
+        if prompt is not None:
+            metrics.sysinfo_prompts.inc('deleted')
+            prompt.discard_file()
 
-            self.shash_handler.add_slash_command(
-                cmd=self.handle_command,
-                name=command_name,
-                description=command_info.get('description'),
-                guild_ids=guild_ids,
-                options=[
-                    create_option(
-                        name='noinline',
-                        description='Disable inline links in message',
-                        option_type=5,
-                        required=False
-                    ),
-                    create_option(
-                        name='mention',
-                        description='Specify a user to ping with the command',
-                        option_type=6,
-                        required=False
+    async def delete_prompt(self, prompt: PendingPrompt):
+        try:
+            await self.http.delete_message(prompt.channel_id, prompt.prompt_message_id)
+        except (discord.NotFound, discord.Forbidden):
+            pass
+
+    async def parse_sysinfo(self, prompt: PendingPrompt, channel: discord.abc.Messageable):
+        async with channel.typing():
+            cached = self.sysinfo_cache.get_sysinfo(prompt.digest)
+            if not cached and self.shared_cache:
+                # Another worker process (or an earlier run) might have parsed it already
+                cached = await self.shared_cache.get_sysinfo(prompt.digest, get_version_tables().fingerprint)
+                if cached:
+                    self.sysinfo_cache.put_sysinfo(prompt.digest, cached.result, cached.utf8, cached.tables_fingerprint)
+            if cached:
+                metrics.sysinfo_prompts.inc('cached')
+                self.logger.info('Sysinfo file was parsed before, using the cached result')
+                prompt.discard_file()
+                result = cached.result
+                utf8_sysinfo = BytesIO(cached.utf8)
+            else:
+                utf8_sysinfo = await self.executor.run_in_thread(prompt.take_file)
+                if utf8_sysinfo is None:
+                    self.logger.warning('Sysinfo file in {} is gone, not parsing it'.format(prompt.description))
+                    return
+                # Take one snapshot of the version tables, they might get swapped out while we're parsing
+                tables = get_version_tables()
+                try:
+                    async with self.executor.reserve():
+                        with metrics.sysinfo_parse_seconds.time():
+                            result = await self.executor.run(handle_sysinfo, utf8_sysinfo, tables)
+                except ExecutorBusy:
+                    metrics.sysinfo_prompts.inc('busy')
+                    await channel.send(
+                        content='Too many sysinfo files are being parsed right now, please try again later',
+                        delete_after=30.0
+                    )
+                    await self.delete_prompt(prompt)
+                    return
+                except Exception as e:
+                    metrics.sysinfo_prompts.inc('failed')
+                    await channel.send(
+                        content='There was an issue parsing this sysinfo file \\:( \n```\n' +
+                                ''.join(traceback.format_exception(type(e), e, e.__traceback__)) + '```',
+                        delete_after=30.0
                     )
-                ]
+                    await self.delete_prompt(prompt)
+                    self.logger.info(
+                        'Failed to parse sysinfo file: \n' +
+                        ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+                    )
+                    return
+                metrics.sysinfo_prompts.inc('parsed')
+                utf8 = utf8_sysinfo.getvalue()
+                self.sysinfo_cache.put_sysinfo(prompt.digest, result, utf8, tables.fingerprint)
+                if self.shared_cache:
+                    self.loop.create_task(self.shared_cache.put_sysinfo(
+                        prompt.digest, CachedSysinfo(result, utf8, tables.fingerprint)
+                    ))
+            if self.diagnosis_store:
+                self.diagnosis_store.add(Diagnosis(
+                    time.time(), prompt.digest, prompt.author_id, prompt.guild_id, prompt.channel_id, result
+                ))
+            info, quickdiagnosis = sysinfo_embeds(result)
+            # Everything goes into one message: the info, the quick fixes (if there are any) and the UTF-8 file
+            response = Response(embeds=[info, quickdiagnosis] if result.quickfixes else [info])
+            # Depending on its size, the file is uploaded as it is, compressed, or only with its important sections
+            export = await self.executor.run_in_thread(export_sysinfo, utf8_sysinfo, prompt.filename)
+            if export:
+                response.content = export.description
+                response.add_file(File(fp=export.fp, filename=export.filename), export.size)
+            with metrics.discord_send_seconds.time('sysinfo_result'):
+                await self.sender.send(channel.id, response)
+        self.logger.info('Parsed sysinfo file in {}'.format(prompt.description))
+        await self.delete_prompt(prompt)
+
+    async def add_commands(self):
+        # They've been read in since start(), so usually this doesn't have to wait
+        await self.commands_read
+
+        # Copies of other commands point to the original's response, so they also use its description
+        for command_name, response in self.command_registry.responses.items():
+            self.add_slash_command(command_name, response)
+        if self.diagnosis_store:
+            self.shash_handler.add_slash_command(
+                cmd=self.handle_diagnoses,
+                name='diagnoses',
+                description=diagnoses_description,
+                options=diagnoses_options
             )
-        # Once all commands are added, push them to Discord
-        # This might not be necessary anymore, but I've found that without it some commands don't update immediately
-        await self.shash_handler.sync_all_commands()
+        # Once all commands are added, push them to every guild that doesn't already have them
+        self.registrar.set_commands(self.command_payload())
+        with self.startup.phase('command sync'):
+            await self.registrar.sync(guild.id for guild in self.guilds)
+
+    def add_slash_command(self, command_name: str, response: CommandResponse):
+        # Commands are registered without guild IDs here, so they work in guilds we join later on as well. Which
+        # guilds actually get them is up to the registrar
+        self.shash_handler.add_slash_command(
+            cmd=self.handle_command,
+            name=command_name,
+            description=response.description,
+            options=command_options
+        )
 
-    def get_command_resp(self, command: str, noinline: bool) -> tuple[Union[str, None], Union[Embed, None], list[File]]:
-        command_info: dict = self.commands_list[command]
+    def command_payload(self) -> list[dict]:
+        payload = [
+            {'name': command_name, 'description': response.description, 'options': command_options}
+            for command_name, response in sorted(self.command_registry.responses.items())
+        ]
+        if self.diagnosis_store:
+            payload.append({'name': 'diagnoses', 'description': diagnoses_description, 'options': diagnoses_options})
+        return payload
+
+    async def watch_commands(self):
+        while not self.is_closed():
+            await asyncio.sleep(command_reload_interval)
+            try:
+                # Checking every file (and parsing the changed ones) happens in a thread, like the first read
+                changes = await asyncio.get_running_loop().run_in_executor(None, self.command_registry.reload)
+                if changes.needs_sync():
+                    self.push_command_changes(changes)
+            except Exception as e:
+                self.logger.error('Failed to reload commands: \n' + ''.join(
+                    traceback.format_exception(type(e), e, e.__traceback__)
+                ))
+
+    def push_command_changes(self, changes: CommandChanges):
+        # Update our local copy first, so the new commands can be used as soon as Discord knows about them
+        for command_name in changes.removed | changes.updated:
+            self.shash_handler.commands.pop(command_name, None)
+        for command_name in changes.added | changes.updated:
+            self.add_slash_command(command_name, self.command_registry.get(command_name))
+        self.registrar.set_commands(self.command_payload())
+        self.registrar.schedule(guild.id for guild in self.guilds)
 
-        # If the command is a copy of another command, run this function with the actual command
-        if command_info.get('copy_of'):
-            self.logger.debug('Command /{} is a copy of /{}, re-running function with that command'.format(
-                command, command_info.get('copy_of')
-            ))
-            return self.get_command_resp(command_info.get('copy_of'), noinline)
-
-        # If we have attachments for this command, read them out and collect them in a list
-        files_to_attach: list[File] = []
-        if os.path.isdir(os.path.join(attachments_dir, command)):
-            for file_or_folder in os.listdir(os.path.join(attachments_dir, command)):
-                if not os.path.isfile(os.path.join(os.path.join(attachments_dir, command), file_or_folder)):
-                    continue
-                files_to_attach.append(File(fp=os.path.join(os.path.join(attachments_dir, command), file_or_folder)))
-
-        # If we don't have a main 'message' component, we don't have to do any formatting
-        if not command_info.get('message'):
-            return command_info.get('raw_message'), None, files_to_attach
-
-        embed = Embed(description='', colour=embed_color)
-        # If we don't have inline links, we don't have to look at 'noinline' at all
-        if not command_info.get('has_inline', False):
-            # We can only either have a string or a list of strings here. If we have just one string, set that as the
-            # description. If we have multiple, join them together
-            if type(command_info.get('message')) is str:
-                embed_description = command_info.get('message')
-            else:
-                embed_description = ''.join(command_info.get('message'))
-        # We have inline links
-        else:
-            if type(command_info.get('message')) is dict:
-                if noinline:
-                    embed_description = '{}: {}'
-                else:
-                    embed_description = '[{}]({})'
-                embed_description = embed_description.format(
-                    command_info.get('message').get('text'), command_info.get('message').get('link')
-                )
-            # We have a list of either text or links
-            else:
-                embed_description = ''
-                message: list[Union[dict, str]] = command_info.get('message')
-                for message_part in message:
-                    if type(message_part) is str:
-                        embed_description += message_part
-                    # We have a link (dict) now
-                    else:
-                        if noinline:
-                            part_to_add = '{}: {}'
-                            # If we have a word right after the link, add a space before it
-                            try:
-                                next_message_part: str = message[message.index(message_part) + 1]
-                            except IndexError:
-                                pass
-                            else:
-                                if type(next_message_part) is str and next_message_part[0] not in (' ', '.', ','):
-                                    part_to_add += ' '
-                        else:
-                            part_to_add = '[{}]({})'
-                        embed_description += part_to_add.format(
-                            message_part.get('text'), message_part.get('link')
-                        )
-
-        # If we have extra description for when inline links are disabled, add that to the description
-        if noinline and command_info.get('noinline_add'):
-            embed_description += '\n\n'
-            embed_description += command_info.get('noinline_add')
-        embed.description = embed_description
-        return command_info.get('raw_message'), embed, files_to_attach
+    def get_command_resp(self, command: str, noinline: bool) -> tuple[Union[str, None], Union[Embed, None], list[File]]:
+        with metrics.command_response_seconds.time(metrics.command_label(command)):
+            return self.command_registry.render(command, noinline)
 
     async def handle_command(self, ctx: SlashContext, noinline: bool = None, mention: User = None):
         self.logger.info('{} used /{} in #{}'.format(ctx.author, ctx.command, ctx.channel))
+        metrics.commands_used.inc(ctx.command)
 
         # If the channel name the command was used in contains "commands" and the user hasn't specifically turned on
         # inline links, assume they want inline links turned off
@@ -274,44 +471,99 @@ class My24HSbot(Bot):
 
         message, embed, attachments = self.get_command_resp(ctx.command, noinline)
 
-        await ctx.defer()
-
-        async with ctx.channel.typing():
-            if not edit_mention:
-                if mention:
-                    message = mention.mention + (f'\n{message}' if message else '')
-
-            if message or embed:
-                main_message = await ctx.send(content=message, embed=embed)
-                if edit_mention:
-                    if mention:
-                        message = mention.mention + (f'\n{message}' if message else '')
-                        await main_message.edit(content=message, embed=embed)
-
-            # If we don't have attachments, we of course can't send any
-            # If 'noinline' is set, the attachment links will already be in the original message
-            # *unless* we don't have an original message, in which case we'll always have to send them
-            if attachments and not (noinline and (message or embed)):
-                # We can only send attachments if we either have access to the channel or we haven't replied to the
-                # command yet
-                can_send_attachments = ctx.channel or (not message and not embed)
-                if can_send_attachments:
-                    if not message and not embed:
-                        await ctx.send(files=attachments)
-                    else:
-                        await ctx.channel.send(files=attachments)
+        with metrics.discord_send_seconds.time('command'):
+            await self.send_command_resp(ctx, message, embed, attachments, noinline, mention)
+
+    async def send_command_resp(
+            self, ctx: SlashContext, message: Union[str, None], embed: Union[Embed, None], attachments: list[File],
+            noinline: bool, mention: Union[User, None]
+    ):
+        response = Response(message, [embed] if embed else [])
+        # If we don't have attachments, we of course can't send any
+        # If 'noinline' is set, the attachment links will already be in the original message
+        # *unless* we don't have an original message, in which case we'll always have to send them
+        if attachments and not (noinline and (message or embed)):
+            for attachment in attachments:
+                response.add_file(attachment)
+        if mention:
+            # With edit_mention, the mention is shown but doesn't ping (like it was edited in after sending)
+            response.mention(mention, ping=not edit_mention)
+        if not response:
+            return
+        # The whole response goes into the interaction response
+        await self.sender.respond(ctx, response)
+
+    async def handle_diagnoses(
+            self, ctx: SlashContext, user: User = None, gpu: str = None, driver: str = None, build: int = None,
+            outdated_gpu: bool = None, outdated_windows: bool = None, days: int = None
+    ):
+        self.logger.info('{} used /diagnoses in #{}'.format(ctx.author, ctx.channel))
+        if not ctx.guild_id or not await self.is_tech_support(ctx):
+            await ctx.send(content='Only tech support can search past sysinfo files', hidden=True)
+            return
+        query = DiagnosisQuery(
+            user_id=user.id if user else None,
+            # Reports from other servers aren't anyone's business here
+            guild_id=ctx.guild_id,
+            gpu=gpu,
+            driver_version=driver,
+            windows_build=build,
+            outdated_gpu=outdated_gpu,
+            outdated_windows=outdated_windows,
+            since=time.time() - days * 24 * 60 * 60 if days else None
+        )
+        summary = await self.diagnosis_store.summarize(query)
+        embed = Embed(
+            title=':mag: Past sysinfo files',
+            description='{} files from {} users'.format(summary.count, summary.users),
+            colour=embed_color
+        )
+        for created, user_id, gpus, windows_build in summary.latest:
+            embed.add_field(
+                name='<t:{}:R>'.format(int(created)),
+                value='<@{}>\n{}\nBuild {}'.format(user_id, gpus or 'No GPU', windows_build),
+                inline=False
+            )
+        await ctx.send(embed=embed, hidden=True)
 
     def is_interesting_message(self, msg: Message) -> bool:
         return msg.attachments and msg.author != self.user
 
-
-def button_check(ctx: ComponentContext) -> bool:
-    # Always allow button presses when in DMs/Groups
-    if not ctx.guild:
-        return True
-
-    # If we are in a guild, check if the member is allowed to press the button
-    member: Member = ctx.guild.get_member(ctx.author.id)
-    if not member:
-        return False
-    return any(role.id in sysinfo_allowed_roles for role in member.roles)
+    async def is_tech_support(self, ctx: Union[ComponentContext, SlashContext]) -> bool:
+        # Used for the sysinfo prompt's buttons and /diagnoses. Always allow button presses when in DMs/Groups
+        if not ctx.guild_id:
+            return True
+        # The interaction comes with the member's roles, as long as we know the guild
+        if isinstance(ctx.author, Member):
+            role_ids = {role.id for role in ctx.author.roles}
+        else:
+            role_ids = await self.member_roles.fetch(ctx.guild_id, ctx.author_id)
+        return not allowed_roles.isdisjoint(role_ids)
+
+
+class ShardedMy24HSbot(My24HSbot, AutoShardedBot):
+    # Runs all shards of the ShardPlan in this process, each with its own gateway connection
+    pass
+
+
+def client_options() -> dict:
+    if not lean_gateway:
+        return {'intents': Intents.all(), 'guild_ready_timeout': guild_ready_timeout}
+    # Guilds (for channels and roles) and messages (for sysinfo files) are all the bot needs. Interactions don't need
+    # an intent, and they come with everything we need to know about the member using them
+    intents = Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    return {
+        'intents': intents,
+        'member_cache_flags': MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+        'guild_ready_timeout': guild_ready_timeout
+    }
+
+
+def create_bot(shard_plan: ShardPlan, **options) -> My24HSbot:
+    if shard_plan.sharded:
+        return ShardedMy24HSbot(shard_plan=shard_plan, **options)
+    return My24HSbot(shard_plan=shard_plan, **options)
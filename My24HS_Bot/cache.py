@@ -0,0 +1,104 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Union
+
+from My24HS_Bot.const import sysinfo_cache_entries, sysinfo_cache_size, sysinfo_cache_ttl
+from My24HS_Bot.sysinfo_parsing import SysinfoResult
+from My24HS_Bot.version_feeds import get_version_tables
+
+
+class LRUCache:
+    def __init__(
+            self,
+            max_entries: int,
+            max_size: int = None,
+            ttl: float = None,
+            sizeof: Callable[[Any], int] = lambda value: 0
+    ):
+        self.max_entries = max_entries
+        # Upper limit for the sum of `sizeof(value)` of all entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.size = 0
+        # key -> (value, size, expiry time). Least recently used entries are at the start
+        self.entries: OrderedDict[Hashable, tuple[Any, int, Union[float, None]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value, _, expires = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires is not None and expires < time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self.pop(key)
+        size = self.sizeof(value)
+        # Something that's bigger than the whole cache would just evict everything else and then itself
+        if self.max_size is not None and size > self.max_size:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.entries[key] = (value, size, expires)
+        self.size += size
+        while len(self.entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value, size, _ = self.entries.pop(key)
+        except KeyError:
+            return default
+        self.size -= size
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+@dataclass
+class CachedSysinfo:
+    result: SysinfoResult
+    utf8: bytes
+    # The driver/Windows version tables the result was checked against
+    tables_fingerprint: str
+
+
+class SysinfoCache(LRUCache):
+    def __init__(self):
+        super().__init__(
+            max_entries=sysinfo_cache_entries,
+            max_size=sysinfo_cache_size,
+            ttl=sysinfo_cache_ttl,
+            sizeof=lambda entry: len(entry.utf8)
+        )
+
+    def get_sysinfo(self, digest: str) -> Union[CachedSysinfo, None]:
+        entry: Union[CachedSysinfo, None] = self.get(digest)
+        if entry is None:
+            return None
+        # If the version tables changed since this was parsed, the up-to-date checks might not be right anymore
+        if entry.tables_fingerprint != get_version_tables().fingerprint:
+            self.pop(digest)
+            return None
+        return entry
+
+    def put_sysinfo(self, digest: str, result: SysinfoResult, utf8: bytes, tables_fingerprint: str):
+        self.put(digest, CachedSysinfo(result, utf8, tables_fingerprint))
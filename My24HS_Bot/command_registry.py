@@ -0,0 +1,336 @@
+import logging
+import os
+import pickle
+from dataclasses import dataclass, field
+from typing import Union
+
+from discord import Embed, File
+
+from My24HS_Bot.attachment_store import AttachmentStore
+from My24HS_Bot.const import commands_dir, attachments_dir, command_bundle_path, embed_color
+
+# Bumped whenever the bundle's format changes, so old bundles are ignored instead of misread
+bundle_version = 1
+
+
+@dataclass(frozen=True)
+class CommandResponse:
+    name: str
+    description: str
+    raw_message: Union[str, None]
+    # Embeds with inline links rendered as Markdown links / as "text: link". None if the command has no 'message'
+    embed: Union[Embed, None]
+    noinline_embed: Union[Embed, None]
+    attachment_paths: tuple[str, ...]
+
+    def render(
+            self, noinline: bool, attachment_store: AttachmentStore
+    ) -> tuple[Union[str, None], Union[Embed, None], list[File]]:
+        files = [attachment_store.open(path) for path in self.attachment_paths]
+        return self.raw_message, self.noinline_embed if noinline else self.embed, files
+
+
+def render_description(command_info: dict, noinline: bool) -> str:
+    message = command_info.get('message')
+    # If we don't have inline links, we don't have to look at 'noinline' at all
+    if not command_info.get('has_inline', False):
+        # We can only either have a string or a list of strings here. If we have just one string, set that as the
+        # description. If we have multiple, join them together
+        if type(message) is str:
+            description = message
+        else:
+            description = ''.join(message)
+    # We have inline links
+    elif type(message) is dict:
+        description = ('{}: {}' if noinline else '[{}]({})').format(message.get('text'), message.get('link'))
+    # We have a list of either text or links
+    else:
+        parts = []
+        for i, message_part in enumerate(message):
+            if type(message_part) is str:
+                parts.append(message_part)
+                continue
+            # We have a link (dict) now
+            if noinline:
+                part_to_add = '{}: {}'
+                # If we have a word right after the link, add a space before it
+                if i + 1 < len(message):
+                    next_message_part = message[i + 1]
+                    if type(next_message_part) is str and next_message_part[0] not in (' ', '.', ','):
+                        part_to_add += ' '
+            else:
+                part_to_add = '[{}]({})'
+            parts.append(part_to_add.format(message_part.get('text'), message_part.get('link')))
+        description = ''.join(parts)
+
+    # If we have extra description for when inline links are disabled, add that to the description
+    if noinline and command_info.get('noinline_add'):
+        description += '\n\n' + command_info.get('noinline_add')
+    return description
+
+
+def find_attachments(command: str) -> tuple[str, ...]:
+    command_attachments_dir = os.path.join(attachments_dir, command)
+    if not os.path.isdir(command_attachments_dir):
+        return ()
+    paths = (os.path.join(command_attachments_dir, file_or_folder)
+             for file_or_folder in os.listdir(command_attachments_dir))
+    return tuple(path for path in paths if os.path.isfile(path))
+
+
+def compile_command(name: str, command_info: dict) -> CommandResponse:
+    embed = noinline_embed = None
+    # If we don't have a main 'message' component, we don't have to do any formatting
+    if command_info.get('message'):
+        embed = Embed(description=render_description(command_info, False), colour=embed_color)
+        noinline_embed = Embed(description=render_description(command_info, True), colour=embed_color)
+    return CommandResponse(
+        name=name,
+        description=command_info.get('description'),
+        raw_message=command_info.get('raw_message'),
+        embed=embed,
+        noinline_embed=noinline_embed,
+        attachment_paths=find_attachments(name)
+    )
+
+
+def resolve_aliases(commands: dict[str, dict]) -> tuple[dict[str, str], dict[str, str]]:
+    # Follows every copy_of chain once. Returns alias -> the command it ends up at, and alias -> why it can't be
+    # resolved (missing targets and cycles, including aliases that lead into one)
+    targets = {name: info['copy_of'] for name, info in commands.items() if info.get('copy_of')}
+    resolved: dict[str, str] = {}
+    errors: dict[str, str] = {}
+    for alias in targets:
+        # Already done as part of an earlier chain
+        if alias in resolved or alias in errors:
+            continue
+        chain = [alias]
+        canonical = error = None
+        while canonical is None and error is None:
+            target = targets[chain[-1]]
+            if not isinstance(target, str):
+                error = '/{} has a copy_of that isn\'t a command name'.format(chain[-1])
+            elif target in resolved:
+                canonical = resolved[target]
+            elif target in errors:
+                error = '/{} is a copy of /{}, which is broken'.format(chain[-1], target)
+            elif target in chain:
+                cycle = chain[chain.index(target):] + [target]
+                error = 'copy_of cycle: {}'.format(' -> '.join('/' + name for name in cycle))
+            elif target not in commands:
+                error = '/{} is a copy of /{}, which does not exist'.format(chain[-1], target)
+            elif target not in targets:
+                canonical = target
+            else:
+                chain.append(target)
+        for name in chain:
+            if canonical is not None:
+                resolved[name] = canonical
+            else:
+                errors[name] = error
+    return resolved, errors
+
+
+@dataclass
+class CommandChanges:
+    added: set[str] = field(default_factory=set)
+    removed: set[str] = field(default_factory=set)
+    # Commands which still exist, but whose description changed (so they have to be updated on Discord's side)
+    updated: set[str] = field(default_factory=set)
+    # Commands whose response changed. This is a superset of `updated`
+    recompiled: set[str] = field(default_factory=set)
+
+    def needs_sync(self) -> bool:
+        return bool(self.added or self.removed or self.updated)
+
+
+class CommandRegistry:
+    def __init__(self):
+        self.logger = logging.getLogger('CommandRegistry')
+        # Command name -> contents of its YAML file
+        self.commands: dict[str, dict] = {}
+        # Command name -> response. Copies point to the response of the command they're a copy of
+        self.responses: dict[str, CommandResponse] = {}
+        # Copies that can't be used -> why
+        self.alias_errors: dict[str, str] = {}
+        self.attachment_store = AttachmentStore()
+        # Used to find out what changed when reloading
+        self.mtimes: dict[str, int] = {}
+        self.attachment_mtimes: dict[str, tuple[tuple[str, int], ...]] = {}
+
+    @staticmethod
+    def scan_commands() -> dict[str, int]:
+        # Command name -> modification time of its YAML file
+        mtimes = {}
+        for file_or_folder in os.listdir(commands_dir):
+            path = os.path.join(commands_dir, file_or_folder)
+            if not os.path.isfile(path):
+                continue
+
+            filename, fileext = os.path.splitext(file_or_folder)
+            if fileext != '.yml':
+                continue
+
+            mtimes[filename] = os.stat(path).st_mtime_ns
+        return mtimes
+
+    @staticmethod
+    def scan_attachments() -> dict[str, tuple[tuple[str, int], ...]]:
+        # Command name -> paths and modification times of its attachments
+        if not os.path.isdir(attachments_dir):
+            return {}
+        attachments = {}
+        for command in os.listdir(attachments_dir):
+            attachments[command] = tuple((path, os.stat(path).st_mtime_ns) for path in find_attachments(command))
+        return attachments
+
+    @staticmethod
+    def load_command(command: str) -> dict:
+        # Most of the time, everything comes out of the bundle. PyYAML is only imported once a file has to be parsed
+        import yaml
+        path = os.path.join(commands_dir, command + '.yml')
+        with open(path) as f:
+            try:
+                # The C loader is a lot faster, but only there if PyYAML was built with libyaml
+                return yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+            except yaml.YAMLError as e:
+                raise ValueError('{} is not valid YAML: {}'.format(path, e)) from e
+
+    @staticmethod
+    def load_bundle() -> dict[str, tuple[int, dict]]:
+        # Command name -> modification time of its YAML file when it was parsed, and its contents
+        if not command_bundle_path:
+            return {}
+        try:
+            with open(command_bundle_path, 'rb') as f:
+                bundle = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return {}
+        if bundle.get('version') != bundle_version or bundle.get('commands_dir') != os.path.abspath(commands_dir):
+            return {}
+        return bundle['commands']
+
+    def save_bundle(self):
+        if not command_bundle_path:
+            return
+        bundle = {
+            'version': bundle_version,
+            'commands_dir': os.path.abspath(commands_dir),
+            'commands': {command: (self.mtimes[command], self.commands[command]) for command in self.mtimes}
+        }
+        if os.path.dirname(command_bundle_path):
+            os.makedirs(os.path.dirname(command_bundle_path), exist_ok=True)
+        # Several worker processes might be writing it at the same time, so each of them uses its own temporary file
+        tmp_path = '{}.{}.tmp'.format(command_bundle_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, command_bundle_path)
+        except OSError as e:
+            self.logger.warning('Failed to save the command bundle: {}'.format(e))
+
+    def read_commands(self):
+        self.mtimes = self.scan_commands()
+        self.attachment_mtimes = self.scan_attachments()
+        bundle = self.load_bundle()
+        parsed = 0
+        for command, mtime in self.mtimes.items():
+            bundled = bundle.get(command)
+            if bundled and bundled[0] == mtime:
+                self.commands[command] = bundled[1]
+            else:
+                self.commands[command] = self.load_command(command)
+                parsed += 1
+        self.logger.info('Read {} commands, {} of them had to be parsed'.format(len(self.mtimes), parsed))
+        if parsed or len(bundle) != len(self.mtimes):
+            self.save_bundle()
+        self.compile()
+
+    def reload(self) -> CommandChanges:
+        # Re-reads only the commands whose YAML file or attachments changed since they were last read
+        mtimes = self.scan_commands()
+        attachment_mtimes = self.scan_attachments()
+        changed_files = {command for command, mtime in mtimes.items() if self.mtimes.get(command) != mtime}
+        removed_files = set(self.mtimes) - set(mtimes)
+        changed_attachments = {
+            command for command in set(attachment_mtimes) | set(self.attachment_mtimes)
+            if attachment_mtimes.get(command) != self.attachment_mtimes.get(command)
+        }
+        if not (changed_files or removed_files or changed_attachments):
+            return CommandChanges()
+
+        for command in changed_files:
+            try:
+                self.commands[command] = self.load_command(command)
+            except (OSError, ValueError) as e:
+                # Probably saved halfway through, keep the old version (if any) and try again next time
+                self.logger.error('Failed to reload /{}: {}'.format(command, e))
+                mtimes.pop(command)
+                if command in self.mtimes:
+                    mtimes[command] = self.mtimes[command]
+        for command in removed_files:
+            self.commands.pop(command, None)
+        for command in changed_attachments:
+            for path, _ in self.attachment_mtimes.get(command, ()):
+                self.attachment_store.invalidate(path)
+        self.mtimes = mtimes
+        self.attachment_mtimes = attachment_mtimes
+        if changed_files or removed_files:
+            self.save_bundle()
+
+        old_responses = self.responses
+        self.compile(changed_files | changed_attachments)
+
+        changes = CommandChanges()
+        for command in set(old_responses) | set(self.responses):
+            old_response = old_responses.get(command)
+            new_response = self.responses.get(command)
+            if old_response is None:
+                changes.added.add(command)
+            elif new_response is None:
+                changes.removed.add(command)
+            elif old_response is not new_response:
+                changes.recompiled.add(command)
+                if old_response.description != new_response.description:
+                    changes.updated.add(command)
+        self.logger.info('Reloaded commands: {} added, {} removed, {} changed'.format(
+            len(changes.added), len(changes.removed), len(changes.recompiled)
+        ))
+        return changes
+
+    def compile(self, commands: set[str] = None):
+        # Without a set of commands, everything is compiled again. Otherwise, only those commands are (and copies
+        # of them, since copies just point to the original's response)
+        if commands is None:
+            self.attachment_store.invalidate()
+        # Reloads run in a thread while commands are being used, so the new responses only replace the old ones once
+        # they're complete
+        old_responses = self.responses
+        responses = {}
+        for command_name, command_info in self.commands.items():
+            if command_info.get('copy_of'):
+                continue
+            if commands is None or command_name in commands or command_name not in old_responses:
+                responses[command_name] = compile_command(command_name, command_info)
+            else:
+                responses[command_name] = old_responses[command_name]
+        # Copies share the original's response object, so using one is the same lookup as using the original
+        aliases, alias_errors = resolve_aliases(self.commands)
+        for command_name, canonical in aliases.items():
+            self.logger.debug('Command /{} is a copy of /{}'.format(command_name, canonical))
+            responses[command_name] = responses[canonical]
+        self.responses = responses
+        # Only report problems once, not on every reload
+        for command_name, error in alias_errors.items():
+            if self.alias_errors.get(command_name) != error:
+                self.logger.error('Skipping /{}: {}'.format(command_name, error))
+        self.alias_errors = alias_errors
+
+    def get(self, command: str) -> CommandResponse:
+        return self.responses[command]
+
+    def render(self, command: str, noinline: bool) -> tuple[Union[str, None], Union[Embed, None], list[File]]:
+        return self.responses[command].render(noinline, self.attachment_store)
+
+    def __len__(self) -> int:
+        return len(self.responses)
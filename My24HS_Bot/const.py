@@ -1,13 +1,78 @@
 import os
-import requests
-from discord import Color
+from typing import Union
 
 
 # Config options
 bot_token = 'INSERT_TOKEN_HERE'
 commands_dir = os.path.join(os.path.curdir, 'commands')
+# All command files are kept in here after they were parsed, so they only have to be parsed again when they change.
+# Empty to always parse them
+command_bundle_path = os.path.join(os.path.curdir, 'cache', 'commands.pickle')
 attachments_dir = os.path.join(os.path.curdir, 'attachments')
 edit_mention = True
+# How often (in seconds) the commands and attachments directories are checked for changes. 0 disables reloading
+command_reload_interval = 10
+# Slash commands are pushed to Discord this many seconds after the last change (joined guilds, reloaded commands...)
+registration_debounce = 5
+# Command attachments are kept in memory after they were first sent. This is the memory budget for them, in bytes
+attachment_cache_size = 64 * 1024 * 1024
+attachment_cache_entries = 256
+# Sysinfo attachments are downloaded and decoded in chunks of this size (in bytes)
+sysinfo_chunk_size = 64 * 1024
+# How much of a sysinfo file (in bytes) is read before deciding whether it actually is one
+sysinfo_header_size = 1024
+# Attachments outside of this size range (in bytes) are never downloaded. Even a minimal msinfo32 report is well
+# above the lower bound
+sysinfo_min_size = 4 * 1024
+sysinfo_max_size = 64 * 1024 * 1024
+# Channel (or category) IDs to look for sysinfo files in. An empty allow list means every channel the bot can see
+sysinfo_channel_allowlist: list[int] = []
+sysinfo_channel_denylist: list[int] = []
+# How many sysinfo files a single user / channel can send, as (files, seconds). Anything above this is ignored
+sysinfo_user_rate_limit = (3, 60.0)
+sysinfo_channel_rate_limit = (10, 60.0)
+# Decoding and parsing sysinfo files happens outside the event loop, either in a 'thread' or a 'process' pool
+sysinfo_executor_type = 'thread'
+sysinfo_executor_workers = 2
+# How many sysinfo files can be downloaded or parsed at the same time. Anything above this is rejected
+sysinfo_queue_limit = 8
+# Time (in seconds) until an unanswered sysinfo prompt gets deleted
+prompt_timeout = 600
+# Maximum number of unanswered sysinfo prompts. Once there are more, the oldest ones are deleted
+prompt_limit = 50
+# Files bigger than this (in bytes) are moved to disk while their prompt is waiting for an answer
+prompt_spill_size = 256 * 1024
+prompt_spill_dir = os.path.join(os.path.curdir, 'cache', 'prompts')
+# The UTF-8 version of a sysinfo file is uploaded as a .txt up to this size (in bytes)...
+sysinfo_upload_plain_size = 1024 * 1024
+# ...compressed ('gzip' or 'zip') up to this size...
+sysinfo_upload_compress_size = 128 * 1024 * 1024
+sysinfo_upload_compression = 'gzip'
+# ...and with only these sections if it's bigger than that, or still too big to upload after compressing. An empty
+# list means nothing gets uploaded then
+sysinfo_summary_sections = [
+    'System Summary',
+    'Display',
+    'Problem Devices',
+    'Drivers',
+    'Startup Programs',
+    'Windows Error Reporting'
+]
+# Discord's upload limit for bots, in bytes
+sysinfo_upload_limit = 8 * 1000 * 1000
+# Parsed sysinfo files are cached (by a hash of their contents), so re-uploads of the same file don't get parsed again
+sysinfo_cache_entries = 64
+# Maximum combined size of all cached files, in bytes
+sysinfo_cache_size = 128 * 1024 * 1024
+# Time (in seconds) after which a cached file is parsed again
+sysinfo_cache_ttl = 6 * 60 * 60
+# Parsed files are also cached in here, shared by all worker processes (and kept across restarts). Empty to disable
+shared_cache_path = os.path.join(os.path.curdir, 'cache', 'sysinfo.sqlite3')
+# Every parsed sysinfo file is stored in here, so past reports can be searched with /diagnoses. Empty to disable
+diagnosis_db_path = os.path.join(os.path.curdir, 'data', 'diagnoses.sqlite3')
+# Parsed files are written once this many are waiting, or every `diagnosis_flush_interval` seconds
+diagnosis_batch_size = 20
+diagnosis_flush_interval = 30
 up_to_date_range = 0
 # These roles are allowed to press the "Yes/No" buttons on the sysinfo prompt
 sysinfo_allowed_roles = [
@@ -22,27 +87,31 @@ sysinfo_allowed_roles = [
     # Admin role in my test server
     566274374014074886
 ]
-# Color of the left bar in an Embed. Dark Red kinda fits the profile picture
-embed_color = Color.dark_red()
-
-
-def download_latest_nvidia_version() -> dict:
-    data: dict = requests.get(
-        'https://raw.githubusercontent.com/24HourSupport/CommonSoftware/main/nvidia_gpu.json'
-    ).json()
-    name_and_version = {}
-    for branch_name, branch_data in data.items():
-        name_and_version[branch_name] = branch_data['version']
-    return name_and_version
-
-
-def download_latest_amd_version() -> dict:
-    data: dict = requests.get('https://raw.githubusercontent.com/24HourSupport/CommonSoftware/main/amd_gpu.json').json()
-    name_and_version = {}
-    for branch_name, branch_data in data.items():
-        name_and_version[branch_name] = branch_data['win_driver_version']
-    return name_and_version
-
+# Roles of members that can't be read from the interaction itself are fetched and kept for this long (in seconds)
+member_roles_ttl = 60
+member_roles_cache_entries = 1024
+# Only subscribe to the gateway events the bot actually uses (guilds and messages) and don't keep any member lists.
+# False gets every event and caches every member, like before
+lean_gateway = True
+# After connecting, discord.py waits until no guild arrived for this long (in seconds) before the bot is ready. Guilds
+# that take longer still get their commands, just after the others
+guild_ready_timeout = 0.5
+# Metrics are served in the Prometheus text format on http://metrics_host:metrics_port/metrics
+# 'off' disables them, 'basic' is cheap enough to always leave on, 'detailed' also times every command separately. With
+# several worker processes, each of them adds its first shard ID to the port
+metrics_mode = 'basic'
+metrics_host = '127.0.0.1'
+metrics_port = 9124
+# Sharding. `shard_count` None runs one unsharded connection, 0 uses as many shards as Discord recommends. The shards
+# can be split up between `shard_workers` processes (which needs an explicit shard count). Both can be set with
+# command line flags as well, see main.py
+shard_count: Union[int, None] = None
+shard_workers = 1
+# Minimum time (in seconds) between two IDENTIFYs of the bot
+shard_identify_interval = 5
+# Color of the left bar in an Embed. Dark Red (discord.Color.dark_red()) kinda fits the profile picture. This is a
+# plain number, so reading the config doesn't have to import discord.py
+embed_color = 0x992d22
 
 system_manufacturer_unknown_values = [
     'To Be Filled By O.E.M.',
@@ -52,8 +121,20 @@ system_model_unknown_values = [
     'To Be Filled By O.E.M.',
     'System Product Name'
 ]
-nvidia_driver_versions = download_latest_nvidia_version()
-amd_driver_versions = download_latest_amd_version()
+# Latest GPU driver versions are downloaded from here. The last good copy is kept in `version_cache_dir`, so the bot
+# can start up without waiting on them
+nvidia_versions_url = 'https://raw.githubusercontent.com/24HourSupport/CommonSoftware/main/nvidia_gpu.json'
+amd_versions_url = 'https://raw.githubusercontent.com/24HourSupport/CommonSoftware/main/amd_gpu.json'
+# Windows builds can be downloaded as well, as {"10": {"<build>": "<version name>", ...}, "11": {...}}. Without a URL,
+# the tables below are used
+windows_versions_url = ''
+version_cache_dir = os.path.join(os.path.curdir, 'cache', 'versions')
+# How often (in seconds) the driver and Windows versions are checked for updates
+version_refresh_interval = 30 * 60
+# Timeout (in seconds) for a single download
+version_request_timeout = 15
+# Fallback for when `windows_versions_url` isn't set and there's no cached copy. Order doesn't matter, builds are
+# sorted by number when they're loaded
 w10_build_to_version = {
     10240: '1507',
     10586: '1511',
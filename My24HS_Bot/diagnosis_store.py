@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Union
+
+from My24HS_Bot.const import diagnosis_db_path, diagnosis_batch_size, diagnosis_flush_interval
+from My24HS_Bot.sysinfo_parsing import SysinfoResult
+
+schema = '''
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    digest TEXT NOT NULL,
+    user_id INTEGER,
+    guild_id INTEGER,
+    channel_id INTEGER,
+    os_name TEXT,
+    windows_build INTEGER,
+    windows_up_to_date INTEGER,
+    ram_gb INTEGER,
+    quickfixes TEXT
+);
+CREATE TABLE IF NOT EXISTS gpus (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    driver_version TEXT,
+    up_to_date INTEGER
+);
+CREATE INDEX IF NOT EXISTS reports_user ON reports(user_id, created);
+CREATE INDEX IF NOT EXISTS reports_guild ON reports(guild_id, created);
+CREATE INDEX IF NOT EXISTS reports_build ON reports(windows_build, created);
+CREATE INDEX IF NOT EXISTS reports_digest ON reports(digest);
+CREATE INDEX IF NOT EXISTS reports_created ON reports(created);
+CREATE INDEX IF NOT EXISTS gpus_driver ON gpus(driver_version);
+DROP INDEX IF EXISTS gpus_name;
+CREATE INDEX IF NOT EXISTS gpus_report ON gpus(report_id);
+'''
+
+
+@dataclass
+class Diagnosis:
+    created: float
+    digest: str
+    user_id: Union[int, None]
+    guild_id: Union[int, None]
+    channel_id: Union[int, None]
+    result: SysinfoResult
+
+
+@dataclass
+class DiagnosisQuery:
+    # Every filter that isn't None has to match
+    user_id: int = None
+    guild_id: int = None
+    # Part of the GPU name, like "GTX 1060"
+    gpu: str = None
+    driver_version: str = None
+    windows_build: int = None
+    digest: str = None
+    # Only reports with at least one outdated GPU driver / an outdated Windows version
+    outdated_gpu: bool = None
+    outdated_windows: bool = None
+    since: float = None
+
+    def where(self) -> tuple[str, list]:
+        conditions = []
+        params = []
+        for column, value in (('r.user_id', self.user_id), ('r.guild_id', self.guild_id),
+                              ('r.windows_build', self.windows_build), ('r.digest', self.digest)):
+            if value is not None:
+                conditions.append('{} = ?'.format(column))
+                params.append(value)
+        if self.since is not None:
+            conditions.append('r.created >= ?')
+            params.append(self.since)
+        if self.outdated_windows is not None:
+            conditions.append('r.windows_up_to_date = ?')
+            params.append(0 if self.outdated_windows else 1)
+        # The driver version is the only GPU filter an index can help with (GPU names are matched anywhere in the name).
+        # With one, the matching GPUs are looked up first. Otherwise, every report is checked for a matching GPU
+        gpu_conditions = []
+        if self.driver_version is not None:
+            gpu_conditions.append('g.driver_version = ?')
+            params.append(self.driver_version)
+        if self.gpu is not None:
+            gpu_conditions.append("g.name LIKE ? ESCAPE '\\'")
+            params.append('%{}%'.format(self.gpu.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')))
+        if self.outdated_gpu is not None:
+            gpu_conditions.append('g.up_to_date = ?')
+            params.append(0 if self.outdated_gpu else 1)
+        if self.driver_version is not None:
+            conditions.append('r.id IN (SELECT g.report_id FROM gpus g WHERE {})'.format(' AND '.join(gpu_conditions)))
+        elif gpu_conditions:
+            conditions.append('EXISTS (SELECT 1 FROM gpus g WHERE g.report_id = r.id AND {})'.format(
+                ' AND '.join(gpu_conditions)
+            ))
+        return ' AND '.join(conditions) or '1', params
+
+
+@dataclass
+class DiagnosisSummary:
+    count: int
+    users: int
+    # (created, user ID, GPU names, Windows build) of the most recent matching reports
+    latest: list[tuple[float, Union[int, None], str, int]]
+
+
+class DiagnosisStore:
+    # Parsed sysinfo files, written in batches from a single background thread (SQLite connections can't be shared
+    # between threads, and this way the event loop never waits for the disk)
+    def __init__(
+            self,
+            path: str = diagnosis_db_path,
+            batch_size: int = diagnosis_batch_size,
+            flush_interval: float = diagnosis_flush_interval
+    ):
+        self.logger = logging.getLogger('DiagnosisStore')
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: list[Diagnosis] = []
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diagnosis-store')
+        self.connection: Union[sqlite3.Connection, None] = None
+        self.flush_task: Union[asyncio.Task, None] = None
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.thread, func, *args)
+
+    def _open(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(schema)
+
+    def _close(self):
+        # Keeps the statistics the query planner uses to pick an index up to date
+        self.connection.execute('PRAGMA optimize')
+        self.connection.close()
+
+    async def start(self):
+        await self.run(self._open)
+        self.flush_task = asyncio.create_task(self.flush_periodically())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        await self.flush()
+        await self.run(self._close)
+        self.thread.shutdown()
+
+    def add(self, diagnosis: Diagnosis):
+        self.pending.append(diagnosis)
+        if len(self.pending) >= self.batch_size:
+            asyncio.create_task(self.flush())
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await self.run(self._write, batch)
+        except sqlite3.Error as e:
+            self.logger.error('Failed to store {} diagnoses: {}'.format(len(batch), e))
+
+    def _write(self, batch: list[Diagnosis]):
+        # One transaction per batch
+        with self.connection:
+            for diagnosis in batch:
+                result = diagnosis.result
+                cursor = self.connection.execute(
+                    'INSERT INTO reports (created, digest, user_id, guild_id, channel_id, os_name, windows_build, '
+                    'windows_up_to_date, ram_gb, quickfixes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (diagnosis.created, diagnosis.digest, diagnosis.user_id, diagnosis.guild_id, diagnosis.channel_id,
+                     result.os_name, result.windows_build, result.windows_up_to_date, result.ram_gb,
+                     result.quickfixes)
+                )
+                self.connection.executemany(
+                    'INSERT INTO gpus (report_id, name, driver_version, up_to_date) VALUES (?, ?, ?, ?)',
+                    ((cursor.lastrowid, name, driver_version, up_to_date)
+                     for name, driver_version, up_to_date in result.gpus)
+                )
+        self.logger.debug('Stored {} diagnoses'.format(len(batch)))
+
+    async def summarize(self, query: DiagnosisQuery, limit: int = 5) -> DiagnosisSummary:
+        # Reports that are still waiting to be written should show up as well
+        await self.flush()
+        return await self.run(self._summarize, query, limit)
+
+    def _summarize(self, query: DiagnosisQuery, limit: int) -> DiagnosisSummary:
+        where, params = query.where()
+        count, users = self.connection.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT r.user_id) FROM reports r WHERE ' + where, params
+        ).fetchone()
+        latest = self.connection.execute(
+            'SELECT r.created, r.user_id, (SELECT group_concat(name, ", ") FROM gpus WHERE report_id = r.id), '
+            'r.windows_build FROM reports r WHERE ' + where + ' ORDER BY r.created DESC LIMIT ?', params + [limit]
+        ).fetchall()
+        return DiagnosisSummary(count, users, [(created, user_id, gpus or '', build)
+                                               for created, user_id, gpus, build in latest])
+
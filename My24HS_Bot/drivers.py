@@ -0,0 +1,81 @@
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Union
+
+# GPUs matching these can also use their vendor's professional driver branch
+professional_gpu_patterns = {
+    'nvidia': re.compile(r'Quadro|Tesla|Grid|NVS|RTX A\d{3,4}'),
+    'amd': re.compile(r'Radeon(\(TM\)| )*Pro\b|FirePro')
+}
+# Branches only professional GPUs can use
+professional_branches = frozenset({'professional', 'pro'})
+
+
+def gpu_vendor(gpu_name: str) -> Union[str, None]:
+    if gpu_name.startswith('NVIDIA'):
+        return 'nvidia'
+    if gpu_name.startswith('AMD'):
+        return 'amd'
+    return None
+
+
+def is_professional_gpu(vendor: str, gpu_name: str) -> bool:
+    pattern = professional_gpu_patterns.get(vendor)
+    return bool(pattern and pattern.search(gpu_name))
+
+
+def nvidia_version(windows_driver_version: str) -> str:
+    # Windows shows NVIDIA drivers as something like 30.0.15.1179, NVIDIA calls that 511.79 (the last 5 digits)
+    digits = windows_driver_version.replace('.', '')[-5:]
+    return digits[0:3] + '.' + digits[3:]
+
+
+def parse_version(version: str) -> Union[tuple[int, ...], None]:
+    try:
+        return tuple(int(part) for part in version.strip().split('.'))
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class DriverStatus:
+    # 'up_to_date' (the latest version of a branch), 'newer' (than every branch, so a beta or hotfix driver),
+    # 'outdated' or 'unknown' (couldn't be checked)
+    state: str
+    latest: str = ''
+    # How many of the known latest branch versions are newer than the installed one
+    behind: int = 0
+
+    @property
+    def is_up_to_date(self) -> Union[bool, None]:
+        if self.state == 'unknown':
+            return None
+        return self.state != 'outdated'
+
+
+class DriverIndex:
+    # The latest driver versions of one vendor, parsed once whenever the feed changes
+    def __init__(self, branches: dict[str, str]):
+        parsed = {branch: parse_version(version) for branch, version in branches.items()}
+        self.version_names = {version: branches[branch] for branch, version in parsed.items() if version}
+        # Indexed by "is this a professional GPU?"
+        all_versions = sorted({version for version in parsed.values() if version})
+        consumer_versions = sorted({version for branch, version in parsed.items()
+                                    if version and branch not in professional_branches})
+        self.releases: dict[bool, list[tuple[int, ...]]] = {False: consumer_versions, True: all_versions}
+        self.versions: dict[bool, frozenset[tuple[int, ...]]] = {
+            professional: frozenset(releases) for professional, releases in self.releases.items()
+        }
+
+    def check(self, driver_version: str, professional: bool = False) -> DriverStatus:
+        releases = self.releases[professional]
+        version = parse_version(driver_version)
+        if not releases or version is None:
+            return DriverStatus('unknown')
+        latest = self.version_names[releases[-1]]
+        if version in self.versions[professional]:
+            return DriverStatus('up_to_date', latest)
+        if version > releases[-1]:
+            return DriverStatus('newer', latest)
+        return DriverStatus('outdated', latest, len(releases) - bisect_right(releases, version))
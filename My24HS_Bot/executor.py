@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable
+
+from My24HS_Bot.const import sysinfo_executor_type, sysinfo_executor_workers, sysinfo_queue_limit
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class ParseExecutor:
+    def __init__(
+            self,
+            executor_type: str = sysinfo_executor_type,
+            workers: int = sysinfo_executor_workers,
+            queue_limit: int = sysinfo_queue_limit
+    ):
+        self.logger = logging.getLogger('ParseExecutor')
+        self.pool: Executor
+        if executor_type == 'process':
+            self.pool = ProcessPoolExecutor(max_workers=workers)
+        elif executor_type == 'thread':
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sysinfo-parse')
+        else:
+            raise ValueError('Unknown executor type {}'.format(executor_type))
+        # Decoding keeps state between chunks (which can't be shared with another process), so it always uses threads
+        self.thread_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sysinfo-decode')
+        self.queue_limit = queue_limit
+        self.queued = 0
+
+    @asynccontextmanager
+    async def reserve(self):
+        # Every download and every parse takes up one spot in the queue while it's running
+        if self.queued >= self.queue_limit:
+            self.logger.warning('Queue is full ({} jobs), rejecting new job'.format(self.queued))
+            raise ExecutorBusy()
+        self.queued += 1
+        try:
+            yield
+        finally:
+            self.queued -= 1
+
+    async def run(self, func: Callable, *args) -> Any:
+        # func, args and the return value have to be picklable if a process pool is used
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    async def run_in_thread(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.thread_pool, func, *args)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.thread_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,85 @@
+import gzip
+import os
+import zipfile
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Union
+
+from My24HS_Bot.const import sysinfo_upload_plain_size, sysinfo_upload_compress_size, sysinfo_upload_limit, \
+    sysinfo_upload_compression, sysinfo_summary_sections, sysinfo_chunk_size
+from My24HS_Bot.sysinfo_parsing import SysinfoDocument
+
+
+@dataclass
+class SysinfoExport:
+    fp: BytesIO
+    filename: str
+    size: int
+    # Shown above the file
+    description: str
+
+
+def compress(data: memoryview, filename: str) -> tuple[BytesIO, str]:
+    # Writes in chunks, so there's never a second uncompressed copy of the file
+    compressed = BytesIO()
+    if sysinfo_upload_compression == 'zip':
+        with zipfile.ZipFile(compressed, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(filename, 'w', force_zip64=len(data) > 0x7fffffff) as f:
+                for start in range(0, len(data), sysinfo_chunk_size):
+                    f.write(data[start:start + sysinfo_chunk_size])
+        filename = os.path.splitext(filename)[0] + '.zip'
+    else:
+        # mtime=0, so the same file always compresses to the same bytes
+        with gzip.GzipFile(filename=filename, mode='wb', fileobj=compressed, mtime=0) as f:
+            for start in range(0, len(data), sysinfo_chunk_size):
+                f.write(data[start:start + sysinfo_chunk_size])
+        filename += '.gz'
+    compressed.seek(0)
+    return compressed, filename
+
+
+def summarize(data: memoryview) -> bytes:
+    # The report header plus only the sections helpers usually look at, copied as they are
+    document = SysinfoDocument(data)
+    header_end = document.sections[0].start if document.sections else len(data)
+    parts = [bytes(data[:header_end])]
+    wanted = set()
+    for name in sysinfo_summary_sections:
+        try:
+            wanted.add(id(document.section(name)))
+        except (KeyError, IndexError):
+            continue
+    for section in document.sections:
+        if id(section) in wanted:
+            parts.append(bytes(data[section.start:section.end]))
+    return b''.join(parts)
+
+
+def export_sysinfo(utf8: BytesIO, filename: str) -> Union[SysinfoExport, None]:
+    # Small files are uploaded as they are, bigger ones compressed, and huge ones (or ones that are still too big
+    # after compressing) only with the most important sections. None if not even that fits
+    data = utf8.getbuffer()
+    size = len(data)
+    try:
+        if size <= sysinfo_upload_plain_size:
+            return SysinfoExport(BytesIO(data), filename, size, 'Sysinfo file in UTF-8 encoding:')
+        if size <= sysinfo_upload_compress_size:
+            fp, compressed_filename = compress(data, filename)
+            compressed_size = fp.getbuffer().nbytes
+            if compressed_size <= sysinfo_upload_limit:
+                return SysinfoExport(
+                    fp, compressed_filename, compressed_size, 'Sysinfo file in UTF-8 encoding (compressed):'
+                )
+        if not sysinfo_summary_sections:
+            return None
+        summary = summarize(data)
+        summary_filename = os.path.splitext(filename)[0] + '_summary.txt'
+        description = 'Most important sections of the sysinfo file in UTF-8 encoding:'
+        if len(summary) <= sysinfo_upload_plain_size:
+            return SysinfoExport(BytesIO(summary), summary_filename, len(summary), description)
+        fp, summary_filename = compress(memoryview(summary), summary_filename)
+        if fp.getbuffer().nbytes <= sysinfo_upload_limit:
+            return SysinfoExport(fp, summary_filename, fp.getbuffer().nbytes, description)
+        return None
+    finally:
+        data.release()
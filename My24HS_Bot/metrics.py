@@ -0,0 +1,184 @@
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Union
+
+from aiohttp import web
+
+from My24HS_Bot.const import metrics_mode, metrics_host, metrics_port
+
+# 'off' turns every metric into a no-op, 'basic' records counters and overall timings (cheap enough to always leave
+# on), 'detailed' additionally records timings per command
+enabled = metrics_mode != 'off'
+detailed = metrics_mode == 'detailed'
+
+default_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def format_labels(labelnames: tuple[str, ...], label_values: tuple[str, ...], extra: str = '') -> str:
+    labels = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for name, value in zip(labelnames, label_values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.append(self)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return '# HELP {0} {1}\n# TYPE {0} {2}\n'.format(self.name, self.documentation, self.type) + ''.join(
+            sample + '\n' for sample in self.samples()
+        )
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        if not enabled:
+            return
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> list[str]:
+        return ['{}{} {}'.format(self.name, format_labels(self.labelnames, label_values), value)
+                for label_values, value in self.values.items()]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float] = None):
+        super().__init__(name, documentation)
+        # Gauges are read when they are scraped, so keeping them up to date doesn't cost anything
+        self.callback = callback
+
+    def samples(self) -> list[str]:
+        if self.callback is None:
+            return []
+        return ['{} {}'.format(self.name, self.callback())]
+
+
+class Timer:
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram: 'Histogram', label_values: tuple[str, ...]):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple = default_buckets
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # Label values -> [count per bucket (last one is +Inf), sum of all values]
+        self.series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        if not enabled:
+            return
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *label_values: str) -> Timer:
+        return Timer(self, label_values)
+
+    def samples(self) -> list[str]:
+        samples = []
+        for label_values, (counts, total) in self.series.items():
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                samples.append('{}_bucket{} {}'.format(
+                    self.name, format_labels(self.labelnames, label_values, 'le="{}"'.format(bucket)), cumulative
+                ))
+            labels = format_labels(self.labelnames, label_values)
+            samples.append('{}_sum{} {}'.format(self.name, labels, total))
+            samples.append('{}_count{} {}'.format(self.name, labels, cumulative))
+        return samples
+
+
+registry: list[Metric] = []
+
+sysinfo_files = Counter(
+    'sysinfo_files_total', 'Text attachments checked for being a sysinfo file, by outcome', ('outcome',)
+)
+sysinfo_download_seconds = Histogram('sysinfo_download_seconds', 'Time spent downloading and decoding attachments')
+sysinfo_prompts = Counter('sysinfo_prompts_total', 'Answered or expired sysinfo prompts, by outcome', ('outcome',))
+sysinfo_prompt_wait_seconds = Histogram(
+    'sysinfo_prompt_wait_seconds', 'Time until someone answered a sysinfo prompt (or it timed out)'
+)
+sysinfo_parse_seconds = Histogram('sysinfo_parse_seconds', 'Time spent parsing sysinfo files (including queueing)')
+commands_used = Counter('commands_total', 'Slash commands used, by command', ('command',))
+command_response_seconds = Histogram(
+    'command_response_seconds', 'Time spent building command responses (per command in detailed mode)', ('command',)
+)
+discord_send_seconds = Histogram('discord_send_seconds', 'Time spent sending messages to Discord', ('kind',))
+# The callbacks for these are filled in by the bot, since that's where the executor and caches live
+sysinfo_queue_depth = Gauge('sysinfo_queue_depth', 'Sysinfo files currently being downloaded or parsed')
+sysinfo_cache_hit_ratio = Gauge('sysinfo_cache_hit_ratio', 'Share of parses answered from the sysinfo cache')
+attachment_cache_hit_ratio = Gauge('attachment_cache_hit_ratio', 'Share of attachments served from memory')
+
+
+def hit_ratio(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0
+
+
+def command_label(command: str) -> str:
+    # Per-command timings multiply the number of histograms by ~90, so they're only recorded in detailed mode
+    return command if detailed else ''
+
+
+def render() -> str:
+    return ''.join(metric.render() for metric in registry)
+
+
+class MetricsServer:
+    def __init__(self, host: str = metrics_host, port: int = metrics_port):
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger('MetricsServer')
+        self.runner: Union[web.AppRunner, None] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.logger.info('Serving metrics on http://{}:{}/metrics'.format(self.host, self.port))
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,81 @@
+import codecs
+import time
+from typing import Union
+
+from discord import Attachment, Message
+
+from My24HS_Bot.const import sysinfo_min_size, sysinfo_max_size, sysinfo_channel_allowlist, \
+    sysinfo_channel_denylist, sysinfo_user_rate_limit, sysinfo_channel_rate_limit
+
+
+class RateLimiter:
+    # One token bucket per key. Buckets start full and refill continuously at `capacity` tokens per `period`
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        # Key -> (tokens, time of last refill)
+        self.buckets: dict[int, tuple[float, float]] = {}
+
+    def tokens(self, key: int, now: float) -> float:
+        tokens, last = self.buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - last) * self.rate)
+
+    def take(self, key: int, now: float):
+        self.buckets[key] = (self.tokens(key, now) - 1, now)
+
+    def prune(self, now: float):
+        # Full buckets are the same as no bucket, so they don't have to be kept around
+        for key in [key for key in self.buckets if self.tokens(key, now) >= self.capacity]:
+            del self.buckets[key]
+
+
+def is_utf16_content_type(content_type: Union[str, None]) -> bool:
+    # Discord sends something like "text/plain; charset=utf-16". Older attachments don't have a content type at all,
+    # those are checked by their BOM only
+    if content_type is None:
+        return True
+    mime_type, _, params = content_type.lower().partition(';')
+    if mime_type.strip() != 'text/plain':
+        return False
+    return params.replace(' ', '') in ('charset=utf-16', 'charset=utf-16le')
+
+
+def has_utf16_bom(header: bytes) -> bool:
+    # msinfo32 always writes a BOM, so a file without one was saved by something else
+    return header.startswith(codecs.BOM_UTF16_LE) or header.startswith(codecs.BOM_UTF16_BE)
+
+
+class SysinfoPrefilter:
+    # Decides whether an attachment is worth downloading, only using what Discord already told us about it
+    def __init__(self):
+        self.user_limiter = RateLimiter(*sysinfo_user_rate_limit)
+        self.channel_limiter = RateLimiter(*sysinfo_channel_rate_limit)
+        self.last_prune = time.monotonic()
+
+    def check(self, message: Message, attachment: Attachment) -> Union[str, None]:
+        # Returns why the attachment was rejected, or None if it should be downloaded
+        channel_ids = {message.channel.id, getattr(message.channel, 'category_id', None)}
+        if sysinfo_channel_allowlist and not channel_ids.intersection(sysinfo_channel_allowlist):
+            return 'channel'
+        if channel_ids.intersection(sysinfo_channel_denylist):
+            return 'channel'
+        # For some reason some attachment files can just not have a file name?
+        if not attachment.filename or not attachment.filename.endswith('.txt'):
+            return 'type'
+        if not is_utf16_content_type(attachment.content_type):
+            return 'type'
+        if not sysinfo_min_size <= attachment.size <= sysinfo_max_size:
+            return 'size'
+
+        now = time.monotonic()
+        if now - self.last_prune > 60:
+            self.user_limiter.prune(now)
+            self.channel_limiter.prune(now)
+            self.last_prune = now
+        # Only take tokens if both buckets have one, so a rejected file doesn't count against the other limit
+        if self.user_limiter.tokens(message.author.id, now) < 1 or \
+                self.channel_limiter.tokens(message.channel.id, now) < 1:
+            return 'rate_limited'
+        self.user_limiter.take(message.author.id, now)
+        self.channel_limiter.take(message.channel.id, now)
+        return None
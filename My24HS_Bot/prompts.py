@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from io import BytesIO
+from typing import Union
+
+from My24HS_Bot.const import prompt_limit, prompt_spill_size, prompt_spill_dir
+
+
+def spill_file(utf8: BytesIO, spill_dir: str = prompt_spill_dir) -> Union[str, None]:
+    # Prompts can wait for a long time, so bigger files are moved to disk in the meantime. Returns the path of the
+    # file on disk, or None if it's small enough to stay in memory. Runs outside of the event loop
+    if utf8.getbuffer().nbytes <= prompt_spill_size:
+        return None
+    os.makedirs(spill_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=spill_dir, suffix='.txt', delete=False) as f:
+        f.write(utf8.getbuffer())
+        return f.name
+
+
+def remove_spilled_file(spill_path: str):
+    try:
+        os.remove(spill_path)
+    except OSError:
+        pass
+
+
+class PendingPrompt:
+    __slots__ = ('prompt_message_id', 'source_message_id', 'channel_id', 'guild_id', 'author_id', 'description',
+                 'filename', 'digest', 'created', 'timeout_handle', '_utf8', '_spill_path')
+
+    def __init__(
+            self, prompt_message_id: int, source_message_id: int, channel_id: int, guild_id: Union[int, None],
+            author_id: int, description: str, filename: str, digest: str
+    ):
+        self.prompt_message_id = prompt_message_id
+        self.source_message_id = source_message_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        # "#channel (sent by user)", only used for logging
+        self.description = description
+        self.filename = filename
+        self.digest = digest
+        self.created = asyncio.get_running_loop().time()
+        self.timeout_handle: Union[asyncio.TimerHandle, None] = None
+        self._utf8: Union[BytesIO, None] = None
+        self._spill_path: Union[str, None] = None
+
+    def keep_file(self, utf8: BytesIO):
+        self._utf8 = utf8
+
+    def file_spilled(self, spill_path: str):
+        # The file was written to disk by spill_file(), so the copy in memory isn't needed anymore. Only for prompts
+        # that are still waiting for an answer, otherwise a take_file() might be running at the same time
+        self._utf8 = None
+        self._spill_path = spill_path
+
+    def take_file(self) -> Union[BytesIO, None]:
+        # Returns None if the file was already taken or discarded
+        if self._utf8 is not None:
+            utf8, self._utf8 = self._utf8, None
+            return utf8
+        if self._spill_path is None:
+            return None
+        spill_path, self._spill_path = self._spill_path, None
+        try:
+            with open(spill_path, 'rb') as f:
+                return BytesIO(f.read())
+        except OSError:
+            return None
+        finally:
+            remove_spilled_file(spill_path)
+
+    def discard_file(self):
+        self._utf8 = None
+        if self._spill_path:
+            remove_spilled_file(self._spill_path)
+            self._spill_path = None
+
+
+class PromptRegistry:
+    def __init__(self, limit: int = prompt_limit, spill_dir: str = prompt_spill_dir):
+        self.limit = limit
+        # Every process needs its own directory, since leftovers are deleted on startup
+        self.spill_dir = spill_dir
+        self.logger = logging.getLogger('PromptRegistry')
+        # Prompt message id -> prompt, oldest first
+        self.prompts: OrderedDict[int, PendingPrompt] = OrderedDict()
+        # Message the sysinfo file was attached to -> prompt message id
+        self.by_source: dict[int, int] = {}
+        # Leftovers from the last run can't be answered anymore
+        if os.path.isdir(spill_dir):
+            for filename in os.listdir(spill_dir):
+                try:
+                    os.remove(os.path.join(spill_dir, filename))
+                except OSError:
+                    pass
+
+    def add(self, prompt: PendingPrompt) -> list[PendingPrompt]:
+        # Returns the prompts that had to be evicted to stay within the limit. Their files are already discarded
+        self.prompts[prompt.prompt_message_id] = prompt
+        self.by_source[prompt.source_message_id] = prompt.prompt_message_id
+        evicted = []
+        while len(self.prompts) > self.limit:
+            evicted.append(self.remove(next(iter(self.prompts))))
+        for evicted_prompt in evicted:
+            evicted_prompt.discard_file()
+            self.logger.info('Too many open prompts, dropped prompt for sysinfo file in {}'.format(
+                evicted_prompt.description
+            ))
+        return evicted
+
+    def remove(self, prompt_message_id: int) -> Union[PendingPrompt, None]:
+        # The caller is responsible for the prompt's file after this
+        prompt = self.prompts.pop(prompt_message_id, None)
+        if prompt is None:
+            return None
+        self.by_source.pop(prompt.source_message_id, None)
+        if prompt.timeout_handle:
+            prompt.timeout_handle.cancel()
+        return prompt
+
+    def remove_by_source(self, source_message_id: int) -> Union[PendingPrompt, None]:
+        prompt_message_id = self.by_source.get(source_message_id)
+        if prompt_message_id is None:
+            return None
+        return self.remove(prompt_message_id)
+
+    def clear(self) -> list[PendingPrompt]:
+        prompts = [self.remove(prompt_message_id) for prompt_message_id in list(self.prompts)]
+        for prompt in prompts:
+            prompt.discard_file()
+        return prompts
+
+    def __len__(self) -> int:
+        return len(self.prompts)
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Iterable, Union
+
+import discord
+from discord_slash import SlashCommand
+
+from My24HS_Bot.const import registration_debounce
+
+
+def normalize_command(command: dict) -> dict:
+    # Discord adds ids, versions etc. to registered commands and leaves out options that are set to their defaults,
+    # so only compare the parts we actually set
+    return {
+        'name': command['name'],
+        'description': command.get('description', ''),
+        'options': [
+            {
+                'name': option['name'],
+                'description': option.get('description', ''),
+                'type': option['type'],
+                'required': option.get('required', False),
+                'choices': option.get('choices') or []
+            } for option in command.get('options') or []
+        ]
+    }
+
+
+def hash_commands(commands: Iterable[dict]) -> str:
+    normalized = sorted((normalize_command(command) for command in commands), key=lambda command: command['name'])
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+class CommandRegistrar:
+    def __init__(self, slash: SlashCommand, debounce: float = registration_debounce):
+        self.slash = slash
+        self.debounce = debounce
+        self.logger = logging.getLogger('CommandRegistrar')
+        self.commands: list[dict] = []
+        self.commands_hash = hash_commands([])
+        # Guild id -> hash of the commands currently registered in that guild
+        self.registered_hashes: dict[int, str] = {}
+        # Guilds waiting for the next (debounced) sync
+        self.pending: set[int] = set()
+        self.task: Union[asyncio.Task, None] = None
+
+    def set_commands(self, commands: list[dict]):
+        self.commands = commands
+        self.commands_hash = hash_commands(commands)
+
+    def schedule(self, guild_ids: Iterable[int]):
+        # Bursts of guild events (or command reloads) within `debounce` seconds get merged into one sync
+        self.pending.update(guild_ids)
+        if not self.task:
+            self.task = asyncio.create_task(self.sync_later())
+
+    def forget(self, guild_id: int):
+        # Once we're not in a guild anymore, its commands are gone as well
+        self.registered_hashes.pop(guild_id, None)
+        self.pending.discard(guild_id)
+
+    async def sync_later(self):
+        await asyncio.sleep(self.debounce)
+        guild_ids, self.pending = self.pending, set()
+        self.task = None
+        await self.sync(guild_ids)
+
+    async def sync(self, guild_ids: Iterable[int]):
+        pushed = 0
+        for guild_id in guild_ids:
+            try:
+                if await self.sync_guild(guild_id):
+                    pushed += 1
+            except discord.HTTPException as e:
+                # Usually means the bot was added without the applications.commands scope
+                self.logger.warning('Failed to sync commands in guild {}: {}'.format(guild_id, e))
+        self.logger.info('Synced commands, {} guilds needed an update'.format(pushed))
+
+    async def sync_guild(self, guild_id: int) -> bool:
+        # We only have to ask Discord what's registered the first time we see a guild, after that we know
+        if guild_id not in self.registered_hashes:
+            registered = await self.slash.req.get_all_commands(guild_id=guild_id)
+            self.registered_hashes[guild_id] = hash_commands(registered)
+        if self.registered_hashes[guild_id] == self.commands_hash:
+            return False
+        # One bulk overwrite replaces all of the guild's commands, including removing ones we don't have anymore
+        await self.slash.req.put_slash_commands(slash_commands=self.commands, guild_id=guild_id)
+        self.registered_hashes[guild_id] = self.commands_hash
+        self.logger.debug('Pushed {} commands to guild {}'.format(len(self.commands), guild_id))
+        return True
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
@@ -0,0 +1,133 @@
+import asyncio
+import weakref
+from dataclasses import dataclass, field
+from typing import Union
+
+from discord import AllowedMentions, Embed, File, User, Member, utils
+from discord.http import HTTPClient, Route
+from discord_slash import SlashContext
+from discord_slash.http import CustomRoute
+
+# Limits of a single Discord message
+max_embeds = 10
+max_files = 10
+max_upload_size = 8 * 1000 * 1000
+
+
+@dataclass
+class Response:
+    # Everything the bot wants to say in one go. Gets sent in as few messages as Discord allows
+    content: Union[str, None] = None
+    embeds: list[Embed] = field(default_factory=list)
+    files: list[File] = field(default_factory=list)
+    # Size (in bytes) of every file in `files`, used to stay below the upload limit
+    file_sizes: list[int] = field(default_factory=list)
+    allowed_mentions: Union[AllowedMentions, None] = None
+
+    def add_file(self, file: File, size: int = 0):
+        self.files.append(file)
+        self.file_sizes.append(size)
+
+    def mention(self, user: Union[User, Member], ping: bool = True):
+        # The mention is always part of the first message. Without pinging, it looks the same as a mention that was
+        # edited in afterwards
+        self.content = user.mention + ('\n' + self.content if self.content else '')
+        if not ping:
+            self.allowed_mentions = AllowedMentions.none()
+
+    def split(self) -> list['Response']:
+        # Splits this into responses that each fit into one message. Content always goes into the first one
+        responses = [Response(self.content, allowed_mentions=self.allowed_mentions)]
+        for embed in self.embeds:
+            if len(responses[-1].embeds) >= max_embeds:
+                responses.append(Response(allowed_mentions=self.allowed_mentions))
+            responses[-1].embeds.append(embed)
+        upload_size = 0
+        for file, size in zip(self.files, self.file_sizes):
+            if len(responses[-1].files) >= max_files or (responses[-1].files and upload_size + size > max_upload_size):
+                responses.append(Response(allowed_mentions=self.allowed_mentions))
+                upload_size = 0
+            responses[-1].add_file(file, size)
+            upload_size += size
+        return [response for response in responses if response]
+
+    def payload(self) -> dict:
+        payload = {}
+        if self.content:
+            payload['content'] = self.content
+        if self.embeds:
+            payload['embeds'] = [embed.to_dict() for embed in self.embeds]
+        if self.allowed_mentions:
+            payload['allowed_mentions'] = self.allowed_mentions.to_dict()
+        return payload
+
+    def form(self) -> list[dict]:
+        # For discord.py's request(), which builds the upload from this again on every try (an aiohttp FormData can
+        # only be sent once, so retrying after a 429 would fail)
+        form = [{'name': 'payload_json', 'value': utils.to_json(self.payload())}]
+        for index, file in enumerate(self.files):
+            form.append({
+                'name': 'file{}'.format(index),
+                'value': file.fp,
+                'filename': file.filename,
+                'content_type': 'application/octet-stream'
+            })
+        return form
+
+    def __bool__(self) -> bool:
+        return bool(self.content or self.embeds or self.files)
+
+
+class ChannelSender:
+    # Sends Responses with multiple embeds (which discord.py's send() can't do yet). Everything sent to one channel
+    # goes through that channel's queue, so under load messages stay in order and only one request per channel waits
+    # on its rate limit bucket at a time
+    def __init__(self, http: HTTPClient):
+        self.http = http
+        self.queues: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def queue(self, channel_id: int) -> asyncio.Lock:
+        lock = self.queues.get(channel_id)
+        if lock is None:
+            lock = self.queues[channel_id] = asyncio.Lock()
+        return lock
+
+    async def send(self, channel_id: int, response: Response) -> list[dict]:
+        # Returns the raw data of every message that was sent
+        lock = self.queue(channel_id)
+        async with lock:
+            return [await self.send_one(channel_id, part) for part in response.split()]
+
+    async def send_one(self, channel_id: int, response: Response) -> dict:
+        route = Route('POST', '/channels/{channel_id}/messages', channel_id=channel_id)
+        if not response.files:
+            return await self.http.request(route, json=response.payload())
+        return await self.upload(route, response)
+
+    async def respond(self, ctx: SlashContext, response: Response):
+        # Answers a slash command. Without files, the response goes straight into the initial interaction response
+        # (one request). Files take longer to upload, so the command is deferred first and the upload edits the
+        # response afterwards.
+        # This uses (and updates) the context's internals, which are only known to work with discord-py-slash-command
+        # 3.0.3. Check it again when updating that
+        if not response.files:
+            route = CustomRoute('POST', '/interactions/{}/{}/callback'.format(ctx.interaction_id, ctx._token))
+            await self.http.request(route, json={'type': 4, 'data': response.payload()})
+        else:
+            await ctx.defer()
+            await self.edit_original(ctx._http.application_id, ctx._token, response)
+        ctx.deferred = False
+        ctx.responded = True
+
+    async def edit_original(self, application_id: int, token: str, response: Response) -> dict:
+        # Answers a deferred interaction. Only needed with files, discord_slash sends those in a way that can't be
+        # retried. The token is part of the path, so every interaction gets its own rate limit bucket
+        route = CustomRoute('PATCH', '/webhooks/{}/{}/messages/@original'.format(application_id, token))
+        return await self.upload(route, response)
+
+    async def upload(self, route: Route, response: Response) -> dict:
+        try:
+            return await self.http.request(route, form=response.form(), files=response.files)
+        finally:
+            for file in response.files:
+                file.close()
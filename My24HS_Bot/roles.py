@@ -0,0 +1,33 @@
+from typing import Union
+
+import discord
+from discord.http import HTTPClient
+
+from My24HS_Bot.cache import LRUCache
+from My24HS_Bot.const import sysinfo_allowed_roles, member_roles_ttl, member_roles_cache_entries
+
+# These roles are allowed to press the sysinfo prompt's buttons and use /diagnoses
+allowed_roles = frozenset(sysinfo_allowed_roles)
+
+
+class MemberRoles:
+    # The bot doesn't keep member lists, so roles are only looked up for whoever pressed a button or used a command.
+    # Interactions already include the member's roles; this is for the rare case where they can't be used (the guild
+    # isn't cached yet, for example)
+    def __init__(self, http: HTTPClient, max_entries: int = member_roles_cache_entries, ttl: float = member_roles_ttl):
+        self.http = http
+        # (guild id, user id) -> role ids
+        self.cache = LRUCache(max_entries, ttl=ttl)
+
+    async def fetch(self, guild_id: int, user_id: int) -> frozenset[int]:
+        key = (guild_id, user_id)
+        role_ids: Union[frozenset[int], None] = self.cache.get(key)
+        if role_ids is None:
+            try:
+                member = await self.http.get_member(guild_id, user_id)
+            except discord.NotFound:
+                # Left the guild in the meantime
+                member = {'roles': []}
+            role_ids = frozenset(int(role_id) for role_id in member['roles'])
+            self.cache.put(key, role_ids)
+        return role_ids
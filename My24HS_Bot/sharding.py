@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from typing import Union
+
+from My24HS_Bot.const import shard_identify_interval
+
+
+@dataclass(frozen=True)
+class ShardPlan:
+    # Total number of shards (None lets Discord decide) and the ones this process runs (None for all of them).
+    # Without sharding, the bot runs as one process with a single connection
+    sharded: bool = False
+    shard_count: Union[int, None] = None
+    shard_ids: Union[tuple[int, ...], None] = None
+
+    @property
+    def name(self) -> str:
+        # Used for everything that has to be separate per process (log names, temporary files...)
+        if not self.sharded:
+            return 'main'
+        if self.shard_ids is None:
+            return 'shards-all'
+        return 'shards-{}-{}'.format(self.shard_ids[0], self.shard_ids[-1])
+
+    @property
+    def first_shard(self) -> int:
+        return self.shard_ids[0] if self.shard_ids else 0
+
+    def bot_options(self) -> dict:
+        if not self.sharded:
+            return {}
+        options = {'shard_count': self.shard_count}
+        if self.shard_ids is not None:
+            options['shard_ids'] = list(self.shard_ids)
+        return options
+
+    def startup_delay(self) -> float:
+        # Discord only allows one IDENTIFY every few seconds per bot. Within a process discord.py takes care of that,
+        # between processes every worker waits until the ones running lower shards are done
+        return self.first_shard * shard_identify_interval
+
+
+def parse_shard_ids(value: str) -> tuple[int, ...]:
+    # "4-7" or "4,5,6,7"
+    shard_ids = set()
+    for part in value.split(','):
+        start, _, end = part.partition('-')
+        shard_ids.update(range(int(start), int(end or start) + 1))
+    return tuple(sorted(shard_ids))
+
+
+def split_shards(shard_count: int, workers: int) -> list[tuple[int, ...]]:
+    # Contiguous ranges, as evenly sized as possible
+    if not 0 < workers <= shard_count:
+        raise ValueError('Need between 1 and {0} workers for {0} shards, got {1}'.format(shard_count, workers))
+    base, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        size = base + (1 if worker < extra else 0)
+        ranges.append(tuple(range(start, start + size)))
+        start += size
+    return ranges
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+
+from My24HS_Bot.cache import CachedSysinfo
+from My24HS_Bot.const import shared_cache_path, sysinfo_cache_entries, sysinfo_cache_size, sysinfo_cache_ttl
+
+schema = '''
+CREATE TABLE IF NOT EXISTS sysinfo (
+    digest TEXT PRIMARY KEY,
+    result BLOB NOT NULL,
+    utf8 BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    tables_fingerprint TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sysinfo_used ON sysinfo(used);
+'''
+
+
+class SharedSysinfoCache:
+    # Second tier behind SysinfoCache. Lives on disk, so every worker process (and the next run) can use results
+    # another one parsed. Same limits as the in-memory cache, with times in wall clock time since it's shared
+    def __init__(
+            self,
+            path: str = shared_cache_path,
+            max_entries: int = sysinfo_cache_entries,
+            max_size: int = sysinfo_cache_size,
+            ttl: float = sysinfo_cache_ttl
+    ):
+        self.logger = logging.getLogger('SharedSysinfoCache')
+        self.path = path
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared-cache')
+        self.connection: Union[sqlite3.Connection, None] = None
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.thread, func, *args)
+
+    def _open(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Other processes might be writing at the same time, wait for them instead of failing right away
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(schema)
+
+    async def start(self):
+        await self.run(self._open)
+
+    async def stop(self):
+        await self.run(self.connection.close)
+        self.thread.shutdown()
+
+    async def get_sysinfo(self, digest: str, tables_fingerprint: str) -> Union[CachedSysinfo, None]:
+        try:
+            return await self.run(self._get, digest, tables_fingerprint)
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            self.logger.warning('Failed to read cached sysinfo file: {}'.format(e))
+            return None
+
+    def _get(self, digest: str, tables_fingerprint: str) -> Union[CachedSysinfo, None]:
+        now = time.time()
+        # Results checked against other version tables are as good as missing
+        row = self.connection.execute(
+            'SELECT result, utf8 FROM sysinfo WHERE digest = ? AND tables_fingerprint = ? AND created > ?',
+            (digest, tables_fingerprint, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute('UPDATE sysinfo SET used = ? WHERE digest = ?', (now, digest))
+        result, utf8 = row
+        return CachedSysinfo(pickle.loads(result), utf8, tables_fingerprint)
+
+    async def put_sysinfo(self, digest: str, entry: CachedSysinfo):
+        try:
+            await self.run(self._put, digest, entry)
+        except sqlite3.Error as e:
+            self.logger.warning('Failed to cache sysinfo file: {}'.format(e))
+
+    def _put(self, digest: str, entry: CachedSysinfo):
+        size = len(entry.utf8)
+        if size > self.max_size:
+            return
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sysinfo (digest, result, utf8, size, tables_fingerprint, created, used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (digest, pickle.dumps(entry.result), entry.utf8, size, entry.tables_fingerprint, now, now)
+            )
+            self.connection.execute('DELETE FROM sysinfo WHERE created <= ?', (now - self.ttl,))
+            # Least recently used entries go first, until both limits are met again
+            count, total_size = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sysinfo'
+            ).fetchone()
+            evicted = []
+            for evicted_digest, evicted_size in self.connection.execute(
+                    'SELECT digest, size FROM sysinfo ORDER BY used'
+            ).fetchall():
+                if count <= self.max_entries and total_size <= self.max_size:
+                    break
+                evicted.append((evicted_digest,))
+                count -= 1
+                total_size -= evicted_size
+            self.connection.executemany('DELETE FROM sysinfo WHERE digest = ?', evicted)
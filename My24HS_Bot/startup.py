@@ -0,0 +1,42 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Union
+
+
+class StartupTimer:
+    # How long each part of starting the bot took, logged once it's ready. Some phases overlap (the commands are read
+    # while logging in, for example), so they don't have to add up to the total
+    def __init__(self):
+        self.logger = logging.getLogger('Startup')
+        self.started = time.perf_counter()
+        # Phase name -> duration in seconds, or the start time while it's still running
+        self.phases: dict[str, float] = {}
+        self.running: set[str] = set()
+        self.finished_at: Union[float, None] = None
+
+    def begin(self, name: str):
+        self.phases[name] = time.perf_counter()
+        self.running.add(name)
+
+    def end(self, name: str):
+        if name in self.running:
+            self.running.discard(name)
+            self.phases[name] = time.perf_counter() - self.phases[name]
+
+    @contextmanager
+    def phase(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def finish(self):
+        # Only the first call counts, later ones (reconnects) aren't part of starting up
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.perf_counter()
+        phases = ', '.join('{} {:.2f}s'.format(name, duration) for name, duration in self.phases.items()
+                           if name not in self.running)
+        self.logger.info('Started in {:.2f}s ({})'.format(self.finished_at - self.started, phases))
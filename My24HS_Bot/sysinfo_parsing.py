@@ -1,10 +1,47 @@
 import logging
-from dataclasses import dataclass
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Union
 
-from discord import Embed
+from My24HS_Bot.drivers import DriverStatus, gpu_vendor, is_professional_gpu
+from My24HS_Bot.version_feeds import VersionTables, WindowsBuildIndex
 
-from My24HS_Bot.const import w10_build_to_version, w11_build_to_version, embed_color, nvidia_driver_versions, \
-    amd_driver_versions, up_to_date_range
+
+# Positions of the items we read out of the [System Summary] section. Item names are translated in localized
+# reports, but their order isn't, so these are used whenever looking up an item by its English name fails
+summary_item_positions = {
+    'OS Name': 0,
+    'Version': 1,
+    'System Manufacturer': 5,
+    'System Model': 6,
+    'Processor': 9,
+    'BIOS Version/Date': 10,
+    'BaseBoard Manufacturer': 14,
+    'BaseBoard Product': 15,
+    'Installed Physical Memory (RAM)': 27,
+    'Device Encryption Support': 36
+}
+# Same thing for sections, these are 0-based positions in the order msinfo32 writes them
+section_positions = {
+    'System Summary': 0,
+    'Memory': 7,
+    'Display': 14
+}
+
+
+@dataclass
+class SysinfoResult:
+    # Plain data only, so this can be sent back from a worker process
+    fields: list[tuple[str, str]]
+    quickfixes: str
+    # The same information in a form that can be stored and searched. None means "couldn't be checked"
+    os_name: str = ''
+    windows_build: int = 0
+    windows_up_to_date: Union[bool, None] = None
+    ram_gb: int = 0
+    # (name, driver version, up to date?) for every GPU
+    gpus: list[tuple[str, str, Union[bool, None]]] = field(default_factory=list)
 
 
 @dataclass
@@ -15,33 +52,168 @@ class WinVerInfo:
     is_insider: bool = False
 
 
+class SysinfoRow(tuple):
+    # The columns of one line in a section. Being a tuple without a __dict__ keeps big sections small in memory
+    __slots__ = ()
+
+    @property
+    def key(self) -> str:
+        return self[0]
+
+    @property
+    def value(self) -> str:
+        return self[1] if len(self) > 1 else ''
+
+
+class SysinfoSection:
+    # Only knows where it is in the file until something asks for its rows, which are then parsed once
+    def __init__(self, document: 'SysinfoDocument', name: str, start: int, end: int):
+        self.document = document
+        self.name = name
+        # Byte range of the section in the file, starting with its "[Section]" header line
+        self.start = start
+        self.end = end
+        self._columns: Union[SysinfoRow, None] = None
+        self._rows: Union[list[SysinfoRow], None] = None
+        # Rows are grouped into records, with a line of only tabs separating them (used for multiple GPUs in [Display])
+        self._records: list[list[SysinfoRow]] = []
+        self._values: dict[str, str] = {}
+
+    def _materialize(self):
+        self._rows = []
+        lines = bytes(self.document.data[self.start:self.end]).decode('utf-8').split('\n')
+        # Every section header is followed by an empty line and a column header line
+        if len(lines) > 2:
+            self._columns = SysinfoRow(sys.intern(column) for column in lines[2].rstrip('\r').split('\t'))
+        start_new_record = True
+        for line in lines[3:]:
+            columns = line.rstrip('\r').split('\t')
+            if not any(columns):
+                # A line with only tabs in it separates two records, a completely empty line just ends the section
+                if len(columns) > 1:
+                    start_new_record = True
+                continue
+            # Keys repeat a lot (every GPU has a "Name", every driver has the same 'Type' values...)
+            columns[0] = sys.intern(columns[0])
+            row = SysinfoRow(columns)
+            if start_new_record:
+                self._records.append([])
+                start_new_record = False
+            self._rows.append(row)
+            self._records[-1].append(row)
+            self._values.setdefault(row.key, row.value)
+
+    @property
+    def columns(self) -> SysinfoRow:
+        # The column header line ("Item", "Value" for most sections, more for things like [Drivers])
+        if self._rows is None:
+            self._materialize()
+        return self._columns or SysinfoRow()
+
+    @property
+    def rows(self) -> list[SysinfoRow]:
+        if self._rows is None:
+            self._materialize()
+        return self._rows
+
+    @property
+    def records(self) -> list[list[SysinfoRow]]:
+        if self._rows is None:
+            self._materialize()
+        return self._records
+
+    def value(self, key: str, position: int = None) -> str:
+        if self._rows is None:
+            self._materialize()
+        try:
+            return self._values[key]
+        except KeyError:
+            if position is None:
+                raise
+        return self._rows[position][1]
+
+    def has(self, key: str) -> bool:
+        if self._rows is None:
+            self._materialize()
+        return key in self._values
+
+    def table(self) -> list[dict[str, str]]:
+        # Rows as {column name: value}, for sections with more than an "Item" and a "Value" column
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+
+def record_value(record: list[SysinfoRow], key: str, position: int) -> str:
+    for columns in record:
+        if columns[0] == key:
+            return columns[1]
+    return record[position][1]
+
+
+class SysinfoDocument:
+    # A UTF-8 encoded msinfo32 report. All sections are found up front, but their contents are only parsed once
+    # they're used, so checks that only need [System Summary] don't pay for [Drivers] or [Startup Programs]
+    section_header = re.compile(rb'^\[.*', re.MULTILINE)
+
+    def __init__(self, data: Union[bytes, memoryview]):
+        self.data = data
+        self.sections: list[SysinfoSection] = []
+        self.sections_by_name: dict[str, SysinfoSection] = {}
+        # Lines before the first section only contain the report date and the system name
+        for match in self.section_header.finditer(data):
+            if self.sections:
+                self.sections[-1].end = match.start()
+            section = SysinfoSection(self, match.group().decode('utf-8').strip()[1:-1], match.start(), len(data))
+            self.sections.append(section)
+            self.sections_by_name.setdefault(section.name, section)
+
+    def section(self, name: str) -> SysinfoSection:
+        try:
+            return self.sections_by_name[name]
+        except KeyError:
+            if name not in section_positions:
+                raise
+        return self.sections[section_positions[name]]
+
+    def summary_value(self, item: str) -> str:
+        section = self.section('System Summary')
+        # Positions are only a fallback for reports in other languages. If the items have their English names, one
+        # that's missing really is missing (and the row at its usual position is something else)
+        position = None if section.has('OS Name') else summary_item_positions.get(item)
+        return section.value(item, position)
+
+
 class SysinfoParser:
-    def __init__(self):
-        self.info = Embed(
-            title=':information_source: System Information',
-            colour=embed_color
-        )
-        self.quickfixes = Embed(
-            title=':tools: Quick Fixes',
-            colour=embed_color,
-            description=''
-        )
+    def __init__(self, tables: VersionTables):
+        # Passed in instead of read globally, since this might run in a worker process with outdated tables
+        self.tables = tables
+        # (name, value) pairs, these get turned into Embed fields once we're back on the event loop
+        self.info: list[tuple[str, str]] = []
+        self.quickfixes = ''
+        self.os_name = ''
+        self.windows_build = 0
+        self.windows_up_to_date: Union[bool, None] = None
+        self.ram_gb = 0
+        self.gpus: list[tuple[str, str, Union[bool, None]]] = []
         self.logger = logging.getLogger('SysinfoParser')
 
     def windows_version(self, os_name: str, windows_build: int):
+        self.os_name = os_name
+        self.windows_build = windows_build
         try:
             if os_name.startswith('Microsoft Windows 11'):
-                ver_info = build_version_check(windows_build, w11_build_to_version)
+                ver_info = build_version_check(windows_build, self.tables.windows_builds['11'])
                 ver_info.current_version_name = '**W11**-' + ver_info.current_version_name
             else:
-                ver_info = build_version_check(windows_build, w10_build_to_version)
-        except ValueError:
+                ver_info = build_version_check(windows_build, self.tables.windows_builds['10'])
+        # KeyError: The version feed doesn't know about this Windows release at all
+        except (ValueError, KeyError):
             self.add_info('Windows version', f':question: Unsure (Build {windows_build})')
             return
 
+        self.windows_up_to_date = ver_info.is_up_to_date
         if not ver_info.is_up_to_date:
             self.add_info('Windows version', f':x: Not up to date ({ver_info.current_version_name})')
-            self.quickfixes.description += '`/systemuptodate`\n - Update Windows\n'
+            self.quickfixes += '`/systemuptodate`\n - Update Windows\n'
             self.logger.info(f'Windows version {ver_info.current_version_name}, not up to date')
             return
 
@@ -56,6 +228,7 @@ class SysinfoParser:
         ram_capacity = ram_capacity.replace(',', '.')
         ram_capacity_gb = int(ram_capacity.split('.')[0])
         self.logger.info('RAM Capacity: {} GB'.format(ram_capacity_gb))
+        self.ram_gb = ram_capacity_gb
         if ram_capacity_gb < 8:
             self.add_info('RAM Capacity', ':warning: {} GB'.format(ram_capacity_gb))
         else:
@@ -64,7 +237,7 @@ class SysinfoParser:
 
     def add_gpus(self, gpu_names, gpu_versions):
         # This determines where and when we have to insert blank fields
-        magic_formatting_num = len(self.info.fields) % 3
+        magic_formatting_num = len(self.info) % 3
         for i in range(len(gpu_names)):
             # If we started with having one field until a new row, add an empty field now
             if magic_formatting_num == 2:
@@ -73,23 +246,24 @@ class SysinfoParser:
             gpuname = gpu_names[i]
             self.add_info('GPU {}'.format(i + 1) if len(gpu_names) != 1 else 'GPU', gpuname)
 
-            gpu_outdated = False
-            if gpuname.startswith('NVIDIA'):
-                if is_up_to_date_nvidia(gpuname, gpu_versions[i]):
-                    gpu_ver_string = ':white_check_mark: Up to date ({})'.format(gpu_versions[i])
-                else:
-                    gpu_ver_string = ':x: Not up to date ({})'.format(gpu_versions[i])
-                    gpu_outdated = True
-            elif gpuname.startswith('AMD'):
-                if is_up_to_date_amd(gpu_versions[i]):
-                    gpu_ver_string = ':white_check_mark: Up to date ({})'.format(gpu_versions[i])
-                else:
-                    gpu_ver_string = ':x: Not up to date ({})'.format(gpu_versions[i])
-                    gpu_outdated = True
+            vendor = gpu_vendor(gpuname)
+            # If we couldn't get the latest driver versions, we can't check them either
+            if vendor in self.tables.drivers:
+                status = self.tables.drivers[vendor].check(gpu_versions[i], is_professional_gpu(vendor, gpuname))
+            else:
+                status = DriverStatus('unknown')
+            gpu_outdated = status.state == 'outdated'
+            if status.state == 'up_to_date':
+                gpu_ver_string = ':white_check_mark: Up to date ({})'.format(gpu_versions[i])
+            elif status.state == 'newer':
+                gpu_ver_string = ':white_check_mark: Newer than latest ({})'.format(gpu_versions[i])
+            elif gpu_outdated:
+                gpu_ver_string = ':x: Not up to date ({}, latest is {})'.format(gpu_versions[i], status.latest)
             else:
                 gpu_ver_string = gpu_versions[i]
 
             self.add_info('Driver Version', gpu_ver_string)
+            self.gpus.append((gpuname, gpu_versions[i], status.is_up_to_date))
 
             # If we started with 2 fields to spare, the first GPU doesn't need a blank field
             if magic_formatting_num == 1:
@@ -101,57 +275,46 @@ class SysinfoParser:
 
             # If the GPU driver we're currently looking at is outdated and the
             # update notice is not yet in the quick fixes, add it
-            if gpu_outdated and ' - Update GPU drivers' not in self.quickfixes.description:
-                if '`/systemuptodate`' not in self.quickfixes.description:
-                    self.quickfixes.description += '`/systemuptodate`\n'
-                self.quickfixes.description += ' - Update GPU drivers\n'
-            self.logger.info('Added GPU {}, driver version {}, up to date? {}'.format(
-                gpuname, gpu_ver_string, gpu_outdated
+            if gpu_outdated and ' - Update GPU drivers' not in self.quickfixes:
+                if '`/systemuptodate`' not in self.quickfixes:
+                    self.quickfixes += '`/systemuptodate`\n'
+                self.quickfixes += ' - Update GPU drivers\n'
+            self.logger.info('Added GPU {}, driver version {}, status {} ({} releases behind)'.format(
+                gpuname, gpu_versions[i], status.state, status.behind
             ))
 
     def add_info(self, name: str, value: str):
         self.logger.debug('Adding info {}, value {}'.format(name, value))
-        self.info.add_field(name=name, value=value)
+        self.info.append((name, value))
 
+    def result(self) -> SysinfoResult:
+        return SysinfoResult(
+            fields=self.info,
+            quickfixes=self.quickfixes,
+            os_name=self.os_name,
+            windows_build=self.windows_build,
+            windows_up_to_date=self.windows_up_to_date,
+            ram_gb=self.ram_gb,
+            gpus=self.gpus
+        )
 
-def build_version_check(build_num: int, build_to_version_name: dict) -> WinVerInfo:
+
+def build_version_check(build_num: int, builds: WindowsBuildIndex) -> WinVerInfo:
     ver_info = WinVerInfo()
-    latest_version_build = list(build_to_version_name.keys())[-1]
-    ver_info.latest_version_name = list(build_to_version_name.values())[-1]
+    ver_info.latest_version_name = builds.latest_name
 
-    if build_num not in build_to_version_name:
+    build = builds.get(build_num)
+    if build is None:
         # If the build number is smaller than the latest build, we know it can't exist
-        if build_num < latest_version_build:
+        if not builds.is_insider(build_num):
             raise ValueError('The build number supplied ({}) does not exist'.format(build_num))
         # If it's greater, it's probably an insider build
-        else:
-            ver_info.is_insider = True
-            ver_info.is_up_to_date = True
-    # If the build number is in the dict
-    else:
-        # Get the version name
-        ver_info.current_version_name = build_to_version_name[build_num]
-        # Get the index of the current version and the most recent version
-        current_ver_index = list(build_to_version_name.keys()).index(build_num)
-        latest_ver_index = list(build_to_version_name.keys()).index(latest_version_build)
-        # First off assume we're up to date
+        ver_info.is_insider = True
         ver_info.is_up_to_date = True
-        # If the current version and the most up to date version are further apart than the specified amount (generally
-        # this is 0, but if a new version releases it might be 1), we're not up to date
-        if latest_ver_index - current_ver_index > up_to_date_range:
-            ver_info.is_up_to_date = False
+    else:
+        ver_info.current_version_name = build.name
+        # If the current version and the most up to date version are further apart than the specified amount
+        # (generally this is 0, but if a new version releases it might be 1), we're not up to date
+        ver_info.is_up_to_date = build.is_up_to_date
     return ver_info
 
-
-def is_up_to_date_nvidia(gpu_name: str, driver_version: str) -> bool:
-    branches = nvidia_driver_versions.copy()
-
-    # The professional driver is only an option if you're using a professional GPU
-    if not any(name in gpu_name for name in ['Quadro', 'Tesla', 'Grid', 'NVS']):
-        branches.pop('professional')
-
-    return any(version == driver_version for version in branches.values())
-
-
-def is_up_to_date_amd(driver_version: str) -> bool:
-    return any(version == driver_version for version in amd_driver_versions.values())
@@ -1,29 +1,55 @@
+import codecs
+import hashlib
+from dataclasses import dataclass
 from io import StringIO, BytesIO
 from typing import Union
 
+from aiohttp import ClientSession
 from discord import Embed, Attachment
 
-from My24HS_Bot.const import system_manufacturer_unknown_values, system_model_unknown_values, nvidia_driver_versions, \
-    amd_driver_versions
-from My24HS_Bot.sysinfo_parsing import SysinfoParser
+from My24HS_Bot.const import system_manufacturer_unknown_values, system_model_unknown_values, sysinfo_chunk_size, \
+    sysinfo_header_size, embed_color
+from My24HS_Bot.drivers import gpu_vendor, nvidia_version
+from My24HS_Bot.executor import ParseExecutor
+from My24HS_Bot.prefilter import has_utf16_bom
+from My24HS_Bot.sysinfo_parsing import SysinfoParser, SysinfoDocument, SysinfoResult, record_value
+from My24HS_Bot.version_feeds import VersionTables
 
 
-def go_to_section(fd: StringIO, section: int):
-    fd.seek(0)
-    i = 0
-    while i < section:
-        curr_line = fd.readline()
-        if curr_line.startswith('['):
-            i += 1
-    for i in range(2):
-        fd.readline()
+@dataclass
+class SysinfoFile:
+    # SHA-256 of the original (UTF-16) attachment
+    digest: str
+    utf8: BytesIO
+
+
+class SysinfoTranscoder:
+    # Converts UTF-16 to UTF-8 chunk by chunk, so we never hold more than one chunk of UTF-16 data in memory
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-16')()
+        self.hash = hashlib.sha256()
+        self.utf8 = BytesIO()
+        # The first few lines of the file, used to check if this is a sysinfo file before reading all of it
+        self.header = ''
+
+    def feed(self, chunk: bytes, final: bool = False):
+        self.hash.update(chunk)
+        text = self.decoder.decode(chunk, final)
+        if len(self.header) < sysinfo_header_size:
+            self.header += text[:sysinfo_header_size - len(self.header)]
+        self.utf8.write(text.encode('utf-8'))
+
+    def is_sysinfo(self) -> bool:
+        return is_sysinfo(StringIO(self.header))
 
 
-def convert_utf16_utf8(fd: BytesIO) -> StringIO:
-    utf8 = StringIO()
-    utf8.writelines(fd.read().decode('utf-16'))
-    utf8.seek(0)
-    return utf8
+def convert_utf16_utf8(fd: BytesIO) -> BytesIO:
+    transcoder = SysinfoTranscoder()
+    while chunk := fd.read(sysinfo_chunk_size):
+        transcoder.feed(chunk)
+    transcoder.feed(b'', final=True)
+    transcoder.utf8.seek(0)
+    return transcoder.utf8
 
 
 def is_sysinfo(fd: StringIO) -> bool:
@@ -45,128 +71,127 @@ def is_sysinfo(fd: StringIO) -> bool:
     return os_name.startswith('Microsoft Windows 1')
 
 
-def handle_sysinfo(fd: StringIO) -> tuple[Embed, Embed]:
-    parser = SysinfoParser()
+def handle_sysinfo(fd: BytesIO, tables: VersionTables) -> SysinfoResult:
+    parser = SysinfoParser(tables)
+    # Sections are only parsed when they're first used, everything else in the file is never looked at
+    index = SysinfoDocument(fd.getbuffer())
 
-    for i in range(5):
-        fd.readline()
-    os_name = fd.readline().split('\t')[1]
-    windows_version = fd.readline().split('\t')[1]
+    os_name = index.summary_value('OS Name')
+    windows_version = index.summary_value('Version')
     windows_build = windows_version.split(' ')[-1]
     parser.windows_version(os_name, int(windows_build))
 
-    for i in range(3):
-        fd.readline()
-    system_manufacturer = fd.readline().split('\t')[1]
+    system_manufacturer = index.summary_value('System Manufacturer')
     system_manufacturer_unknown = system_manufacturer in system_manufacturer_unknown_values
     if not system_manufacturer_unknown:
         parser.add_info('System Manufacturer', system_manufacturer)
-    system_model = fd.readline().split('\t')[1]
+    system_model = index.summary_value('System Model')
     system_model_unknown = system_model in system_model_unknown_values
     if not system_model_unknown:
         parser.add_info('System Model', system_model)
 
-    for i in range(2):
-        fd.readline()
-    processor = fd.readline().split('\t')[1].split(',')[0]
-    bios_info = fd.readline().split('\t')[1]
-    # Don't add them yet, they'll be added once BaseBoard is read out
-    if not (system_manufacturer_unknown or system_model_unknown):
-        parser.add_info('Processor', processor)
-        parser.add_info('BIOS Version & Date', bios_info)
-
-    for i in range(3):
-        fd.readline()
-    # If the System Manufacturer or the System Model is deemed unknown/unhelpful, try to read out BaseBoard instead
-    baseboard_manufacturer_line = fd.readline()
-    if system_manufacturer_unknown or system_model_unknown:
-        if system_manufacturer_unknown:
-            baseboard_manufacturer = baseboard_manufacturer_line.split('\t')[1]
-            parser.add_info('System Manufacturer', baseboard_manufacturer)
-        if system_model_unknown:
-            baseboard_product = fd.readline().split('\t')[1]
-            parser.add_info('System Model', baseboard_product)
-        else:
-            fd.readline()
-        # Skip "BaseBoard-Version" and "Platform Role"
-        for i in range(2):
-            fd.readline()
-        # And now we add the CPU and BIOS info
-        parser.add_info('Processor', processor)
-        parser.add_info('BIOS Version & Date', bios_info)
-    else:
-        for i in range(3):
-            fd.readline()
-
-    # At this point, we should be at "Secure Boot State"
-
-    for i in range(9):
-        fd.readline()
-    ram_capacity = fd.readline().split('\t')[1]
-    parser.ram_capacity(ram_capacity)
+    # If the System Manufacturer or the System Model is deemed unknown/unhelpful, use BaseBoard instead (as long as
+    # the report has BaseBoard info, some don't)
+    if system_manufacturer_unknown:
+        try:
+            parser.add_info('System Manufacturer', index.summary_value('BaseBoard Manufacturer'))
+        except KeyError:
+            pass
+    if system_model_unknown:
+        try:
+            parser.add_info('System Model', index.summary_value('BaseBoard Product'))
+        except KeyError:
+            pass
+
+    parser.add_info('Processor', index.summary_value('Processor').split(',')[0])
+    parser.add_info('BIOS Version & Date', index.summary_value('BIOS Version/Date'))
+
+    parser.ram_capacity(index.summary_value('Installed Physical Memory (RAM)'))
 
-    for i in range(8):
-        fd.readline()
     # If TPM is in here, there was an error with it, so it's not supported
-    tpm_available = 'TPM' not in fd.readline().split('\t')[1]
+    tpm_available = 'TPM' not in index.summary_value('Device Encryption Support')
     parser.logger.info('TPM is {}supported'.format('' if tpm_available else 'not '))
 
     tpm_version = 'Unknown'
     if tpm_available:
-        # Go to [Memory]
-        go_to_section(fd, 8)
-        for line in fd:
-            try:
-                device = line.split('\t')[1]
-            except IndexError:
-                # If we haven't found the TPM version info in there, it isn't loaded and thus not available
-                # This usually indicates some other problem earlier on (maybe some lines are missing in the system
-                # summary section), but once we 'go_to_section' we should be able to ignore them
-                tpm_available = False
-                break
-            if device.startswith('Trusted Platform Module'):
-                tpm_version = device.split(' ')[-1]
+        # If we don't find the TPM in [Memory], it isn't loaded and thus not available
+        tpm_available = False
+        for columns in index.section('Memory').rows:
+            if len(columns) > 1 and columns[1].startswith('Trusted Platform Module'):
+                tpm_version = columns[1].split(' ')[-1]
+                tpm_available = True
                 break
     parser.add_info('TPM Version', ':white_check_mark: ' + tpm_version if tpm_available else ':x: Not supported')
 
-    # Go to [Display]
-    go_to_section(fd, 15)
-
     # We're accounting for multi-GPU systems by creating lists here
     gpunames: list[str] = []
     gpuversions: list[str] = []
-    gpu_done = False
-    while not gpu_done:
-        gpunames.append(fd.readline().split('\t')[1])
-        for i in range(5):
-            fd.readline()
-        gpu_driver_version = fd.readline().split('\t')[1]
+    for gpu in index.section('Display').records:
+        gpunames.append(record_value(gpu, 'Name', 0))
+        gpu_driver_version = record_value(gpu, 'Driver Version', 6)
         # For NVIDIA GPUs, we can format the version string properly and later check if the driver is up to date
-        if gpunames[-1].startswith('NVIDIA'):
-            gpu_driver_version = gpu_driver_version.replace('.', '')[-5:]
-            gpu_driver_version = gpu_driver_version[0:3] + '.' + gpu_driver_version[3:]
+        if gpu_vendor(gpunames[-1]) == 'nvidia':
+            gpu_driver_version = nvidia_version(gpu_driver_version)
         gpuversions.append(gpu_driver_version)
-        for line in fd:
-            # Two tabs are used to indicate that there's another GPU installed.
-            # If that's the case, run the while-Loop again to add the next GPU
-            if line.startswith('\t\t'):
-                break
-            # If [ is encountered, the next section was reached. If that's the case, we're done with listing GPUs
-            if line.startswith('['):
-                gpu_done = True
-                break
 
     # Add all detected GPUs to the system info embed
     parser.add_gpus(gpunames, gpuversions)
 
-    fd.seek(0)
-    return parser.info, parser.quickfixes
+    return parser.result()
+
+
+def sysinfo_embeds(result: SysinfoResult) -> tuple[Embed, Embed]:
+    info = Embed(
+        title=':information_source: System Information',
+        colour=embed_color
+    )
+    for name, value in result.fields:
+        info.add_field(name=name, value=value)
+    quickfixes = Embed(
+        title=':tools: Quick Fixes',
+        colour=embed_color,
+        description=result.quickfixes
+    )
+    return info, quickfixes
+
+
+async def fetch_sysinfo_header(attachment: Attachment, session: ClientSession) -> bytes:
+    # Only asks for the first few KB, enough to tell whether this is a sysinfo file at all
+    async with session.get(attachment.url, headers={'Range': 'bytes=0-{}'.format(sysinfo_header_size - 1)}) as resp:
+        resp.raise_for_status()
+        header = b''
+        # If the server ignored the range, we just stop reading once we have enough
+        while len(header) < sysinfo_header_size:
+            chunk = await resp.content.read(sysinfo_header_size - len(header))
+            if not chunk:
+                break
+            header += chunk
+    return header
 
 
-async def download_sysinfo(attachment: Attachment) -> Union[StringIO, bool]:
-    storage = BytesIO()
-    await attachment.save(storage)
-    utf8_sysinfo = convert_utf16_utf8(storage)
-    if not is_sysinfo(utf8_sysinfo):
+async def download_sysinfo(
+        attachment: Attachment, session: ClientSession, executor: ParseExecutor
+) -> Union[SysinfoFile, bool]:
+    header = await fetch_sysinfo_header(attachment, session)
+    if not has_utf16_bom(header):
+        return False
+    transcoder = SysinfoTranscoder()
+    try:
+        transcoder.feed(header)
+        if not transcoder.is_sysinfo():
+            return False
+        # Now that we know it's a sysinfo file, download the rest of it
+        if len(header) < attachment.size:
+            async with session.get(attachment.url, headers={'Range': 'bytes={}-'.format(len(header))}) as resp:
+                resp.raise_for_status()
+                # Without support for ranges, we get the whole file again
+                if resp.status != 206:
+                    await resp.content.readexactly(len(header))
+                while chunk := await resp.content.read(sysinfo_chunk_size):
+                    await executor.run_in_thread(transcoder.feed, chunk)
+        transcoder.feed(b'', final=True)
+    # Text files that aren't UTF-16 usually fail to decode
+    except UnicodeError:
         return False
-    return utf8_sysinfo
+    transcoder.utf8.seek(0)
+    return SysinfoFile(transcoder.hash.hexdigest(), transcoder.utf8)
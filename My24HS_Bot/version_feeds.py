@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Union
+
+import aiohttp
+
+from My24HS_Bot.const import nvidia_versions_url, amd_versions_url, windows_versions_url, version_cache_dir, \
+    version_refresh_interval, version_request_timeout, w10_build_to_version, w11_build_to_version, up_to_date_range
+from My24HS_Bot.drivers import DriverIndex
+
+
+def default_windows_versions() -> dict[str, dict[str, str]]:
+    # Same format as the Windows feed (and thus JSON-safe): Windows release -> build -> version name
+    return {
+        '10': {str(build): name for build, name in w10_build_to_version.items()},
+        '11': {str(build): name for build, name in w11_build_to_version.items()}
+    }
+
+
+@dataclass(frozen=True)
+class WindowsBuild:
+    name: str
+    # Position in the release order, starting at 0 for the oldest build
+    ordinal: int
+    # Within `up_to_date_range` releases of the latest one
+    is_up_to_date: bool
+
+
+class WindowsBuildIndex:
+    # Everything build_version_check needs to know, worked out once per version of the tables
+    def __init__(self, build_to_version_name: dict[int, str], up_to_date_range: int = up_to_date_range):
+        self.builds: dict[int, WindowsBuild] = {}
+        ordered_builds = sorted(build_to_version_name)
+        self.latest_build = ordered_builds[-1] if ordered_builds else 0
+        self.latest_name = build_to_version_name.get(self.latest_build, '')
+        for ordinal, build in enumerate(ordered_builds):
+            self.builds[build] = WindowsBuild(
+                name=build_to_version_name[build],
+                ordinal=ordinal,
+                is_up_to_date=len(ordered_builds) - 1 - ordinal <= up_to_date_range
+            )
+
+    def get(self, build: int) -> Union[WindowsBuild, None]:
+        return self.builds.get(build)
+
+    def is_insider(self, build: int) -> bool:
+        # Builds newer than the latest release can only be Insider builds
+        return build > self.latest_build
+
+
+@dataclass(frozen=True)
+class VersionTables:
+    # Branch name -> latest driver version
+    nvidia: dict[str, str] = field(default_factory=dict)
+    amd: dict[str, str] = field(default_factory=dict)
+    # Windows release ("10", "11") -> build number (as a string) -> version name
+    windows: dict[str, dict[str, str]] = field(default_factory=default_windows_versions)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        # Changes whenever anything that sysinfo results are checked against changes
+        tables = [self.nvidia, self.amd, self.windows, up_to_date_range]
+        return hashlib.sha256(json.dumps(tables, sort_keys=True).encode()).hexdigest()
+
+    @cached_property
+    def windows_builds(self) -> dict[str, WindowsBuildIndex]:
+        return {
+            release: WindowsBuildIndex({int(build): name for build, name in builds.items()})
+            for release, builds in self.windows.items()
+        }
+
+    @cached_property
+    def drivers(self) -> dict[str, DriverIndex]:
+        # Vendors without any known versions are left out, since there's nothing to check against
+        return {vendor: DriverIndex(branches) for vendor, branches in (('nvidia', self.nvidia), ('amd', self.amd))
+                if branches}
+
+    def prepare(self):
+        # Builds all lookup tables right away, so the first parse doesn't have to
+        for attribute in ('fingerprint', 'windows_builds', 'drivers'):
+            getattr(self, attribute)
+
+
+@dataclass
+class VersionFeed:
+    # Name of the VersionTables attribute this feed fills in
+    name: str
+    url: str
+    # Key of the version string in every branch of the downloaded JSON
+    version_key: str
+    etag: Union[str, None] = None
+    last_modified: Union[str, None] = None
+
+    def extract(self, data: dict) -> dict[str, str]:
+        return {branch_name: branch_data[self.version_key] for branch_name, branch_data in data.items()}
+
+
+class WindowsVersionFeed(VersionFeed):
+    def extract(self, data: dict) -> dict[str, dict[str, str]]:
+        # Parsing the build numbers here makes a broken feed fail the refresh instead of the next parse
+        return {
+            release: {str(int(build)): str(name) for build, name in builds.items()}
+            for release, builds in data.items()
+        }
+
+
+def default_feeds() -> list[VersionFeed]:
+    feeds = [
+        VersionFeed('nvidia', nvidia_versions_url, 'version'),
+        VersionFeed('amd', amd_versions_url, 'win_driver_version')
+    ]
+    if windows_versions_url:
+        feeds.append(WindowsVersionFeed('windows', windows_versions_url, ''))
+    return feeds
+
+
+# The tables currently in use. This only ever gets replaced as a whole, so readers always see a consistent snapshot
+_version_tables = VersionTables()
+
+
+def get_version_tables() -> VersionTables:
+    return _version_tables
+
+
+def set_version_tables(tables: VersionTables):
+    global _version_tables
+    tables.prepare()
+    _version_tables = tables
+
+
+class VersionFeedService:
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            feeds: list[VersionFeed] = None,
+            cache_dir: str = version_cache_dir,
+            refresh_interval: float = version_refresh_interval
+    ):
+        self.session = session
+        self.feeds = feeds if feeds is not None else default_feeds()
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self.logger = logging.getLogger('VersionFeeds')
+        self.task: Union[asyncio.Task, None] = None
+
+    def cache_path(self, feed: VersionFeed) -> str:
+        return os.path.join(self.cache_dir, feed.name + '.json')
+
+    def load_cached(self, max_age: float = None) -> set[str]:
+        # Returns the names of the feeds that had a cached copy (checked or written within `max_age` seconds, if set)
+        tables = {}
+        for feed in self.feeds:
+            try:
+                if max_age is not None and time.time() - os.path.getmtime(self.cache_path(feed)) >= max_age:
+                    continue
+                with open(self.cache_path(feed)) as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                if max_age is None:
+                    self.logger.info('No cached {} versions available'.format(feed.name))
+                continue
+            feed.etag = cached.get('etag')
+            feed.last_modified = cached.get('last_modified')
+            tables[feed.name] = cached['versions']
+        changed = {name: versions for name, versions in tables.items()
+                   if versions != getattr(get_version_tables(), name)}
+        if changed:
+            self.swap_tables(**changed)
+        return set(tables)
+
+    def save_cached(self, feed: VersionFeed, versions: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first, so a crash can't leave a half-written cache behind. Other worker processes
+        # might be writing the same feed, so every process gets its own
+        tmp_path = '{}.{}.tmp'.format(self.cache_path(feed), os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'etag': feed.etag, 'last_modified': feed.last_modified, 'versions': versions}, f)
+        os.replace(tmp_path, self.cache_path(feed))
+
+    def touch_cached(self, feed: VersionFeed):
+        # Marks the cached copy as checked just now, so other worker processes don't download it again
+        try:
+            os.utime(self.cache_path(feed))
+        except OSError:
+            pass
+
+    @staticmethod
+    def swap_tables(**tables: dict):
+        set_version_tables(replace(get_version_tables(), **tables))
+
+    async def refresh(self, feed: VersionFeed) -> bool:
+        headers = {}
+        if feed.etag:
+            headers['If-None-Match'] = feed.etag
+        if feed.last_modified:
+            headers['If-Modified-Since'] = feed.last_modified
+        async with self.session.get(
+                feed.url, headers=headers, timeout=aiohttp.ClientTimeout(total=version_request_timeout)
+        ) as resp:
+            if resp.status == 304:
+                self.logger.debug('{} versions did not change'.format(feed.name))
+                self.touch_cached(feed)
+                return False
+            resp.raise_for_status()
+            # raw.githubusercontent.com serves JSON as text/plain
+            data = await resp.json(content_type=None)
+            feed.etag = resp.headers.get('ETag')
+            feed.last_modified = resp.headers.get('Last-Modified')
+        versions = feed.extract(data)
+        if versions == getattr(get_version_tables(), feed.name):
+            self.save_cached(feed, versions)
+            return False
+        self.swap_tables(**{feed.name: versions})
+        self.save_cached(feed, versions)
+        self.logger.info('Updated {} versions: {}'.format(feed.name, versions))
+        return True
+
+    async def refresh_all(self):
+        # With several worker processes, whoever gets to a feed first downloads it and the others use that copy
+        recently_checked = self.load_cached(max_age=self.refresh_interval)
+        for feed in self.feeds:
+            if feed.name in recently_checked:
+                continue
+            try:
+                await self.refresh(feed)
+            # Keep using the last good copy if anything goes wrong
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, AttributeError) as e:
+                self.logger.warning('Failed to refresh {} versions: {!r}'.format(feed.name, e))
+
+    async def start(self):
+        cached = self.load_cached()
+        # Without a cached copy we don't have anything (or only the built-in Windows versions) to check against, so
+        # wait for the first download
+        if any(feed.name not in cached for feed in self.feeds):
+            await self.refresh_all()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            # Starts with a refresh, so an old cached copy doesn't stay in use for another interval. Whatever was just
+            # downloaded in start() (or by another worker process) counts as recently checked and gets skipped
+            await self.refresh_all()
+            await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
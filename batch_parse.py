@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import asdict
+from typing import Iterator, Union, TextIO
+
+import aiohttp
+
+from My24HS_Bot.prefilter import has_utf16_bom
+from My24HS_Bot.util import SysinfoTranscoder, handle_sysinfo
+from My24HS_Bot.version_feeds import VersionFeedService, VersionTables, get_version_tables, set_version_tables
+
+logger = logging.getLogger('BatchParse')
+
+
+def is_candidate(name: str) -> bool:
+    return name.lower().endswith('.txt')
+
+
+def iter_sources(paths: list[str]) -> Iterator[tuple[str, Union[bytes, None]]]:
+    # (name, contents) of every file to parse. Plain files are read by the workers, so their contents are None here.
+    # Archive members are read one at a time, so only the ones currently being parsed are in memory
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if is_candidate(filename):
+                        yield os.path.join(dirpath, filename), None
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir() and is_candidate(member.filename):
+                        yield '{}:{}'.format(path, member.filename), archive.read(member)
+        elif tarfile.is_tarfile(path):
+            with tarfile.open(path) as archive:
+                for member in archive:
+                    if member.isfile() and is_candidate(member.name):
+                        yield '{}:{}'.format(path, member.name), archive.extractfile(member).read()
+        else:
+            yield path, None
+
+
+def parse_source(source: str, data: Union[bytes, None]) -> dict:
+    # Runs in a worker process. Uses whatever version tables the worker was started with
+    record = {'source': source}
+    try:
+        if data is None:
+            with open(source, 'rb') as f:
+                data = f.read()
+        transcoder = SysinfoTranscoder()
+        try:
+            transcoder.feed(data, final=True)
+            record['sysinfo'] = has_utf16_bom(data) and transcoder.is_sysinfo()
+        except UnicodeError:
+            record['sysinfo'] = False
+        record['digest'] = transcoder.hash.hexdigest()
+        if not record['sysinfo']:
+            return record
+        transcoder.utf8.seek(0)
+        record.update(asdict(handle_sysinfo(transcoder.utf8, get_version_tables())))
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    return record
+
+
+async def load_version_tables(offline: bool) -> VersionTables:
+    # Same tables the bot would use: the cached ones, refreshed if there are none (unless we're offline)
+    async with aiohttp.ClientSession() as session:
+        service = VersionFeedService(session)
+        if offline:
+            service.load_cached()
+        else:
+            await service.start()
+            await service.stop()
+    return get_version_tables()
+
+
+def run(paths: list[str], output: TextIO, workers: int, tables: VersionTables) -> dict[str, int]:
+    counts = {'files': 0, 'sysinfo': 0, 'errors': 0}
+    # Only a few jobs per worker are in flight at once, so huge directories/archives don't end up in memory
+    max_in_flight = workers * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_version_tables, initargs=(tables,)) as pool:
+        in_flight = set()
+        sources = iter_sources(paths)
+        while True:
+            for source, data in sources:
+                in_flight.add(pool.submit(parse_source, source, data))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                counts['files'] += 1
+                counts['sysinfo'] += bool(record.get('sysinfo'))
+                counts['errors'] += 'error' in record
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.flush()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse msinfo32 exports without the bot, writing one JSON object per file (JSON Lines)'
+    )
+    parser.add_argument('paths', nargs='+', help='Files, directories, .zip or .tar(.gz) archives')
+    parser.add_argument('--output', '-o', help='Write results to this file instead of stdout')
+    parser.add_argument('--workers', '-j', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--offline', action='store_true',
+                        help='Only use cached driver versions, never download them')
+    args = parser.parse_args()
+
+    tables = asyncio.run(load_version_tables(args.offline))
+    if not (tables.nvidia and tables.amd):
+        logger.warning('Not all driver versions are available, GPU drivers might not be checked')
+
+    start = time.perf_counter()
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        counts = run(args.paths, output, args.workers, tables)
+    finally:
+        if args.output:
+            output.close()
+    logger.info('Parsed {} files ({} sysinfo files, {} errors) in {:.1f}s'.format(
+        counts['files'], counts['sysinfo'], counts['errors'], time.perf_counter() - start
+    ))
+
+
+if __name__ == '__main__':
+    # Only our own progress is interesting here, the parser logs every single field
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='[%(asctime)s] [%(name)s/%(levelname)s] %(message)s',
+        datefmt='%H:%M:%S'
+    )
+    logger.setLevel(logging.INFO)
+    main()
@@ -0,0 +1,408 @@
+import asyncio
+import json
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Union
+
+import discord.http
+import discord_slash.http
+from aiohttp import web, WSMsgType
+
+# Every path the bot uses, with their major parameter (which decides the rate limit bucket, like on Discord)
+route_templates = [
+    ('/gateway', None),
+    ('/gateway/bot', None),
+    ('/users/@me', None),
+    ('/channels/{id}/messages', 'channel'),
+    ('/channels/{id}/messages/{id}', 'channel'),
+    ('/channels/{id}/typing', 'channel'),
+    ('/guilds/{id}/members/{id}', 'guild'),
+    ('/interactions/{id}/{token}/callback', 'interaction'),
+    ('/webhooks/{id}/{token}', 'webhook'),
+    ('/webhooks/{id}/{token}/messages/{id}', 'webhook'),
+    ('/webhooks/{id}/{token}/messages/@original', 'webhook'),
+    ('/applications/{id}/commands', 'application'),
+    ('/applications/{id}/commands/{id}', 'application'),
+    ('/applications/{id}/guilds/{id}/commands', 'guild'),
+    ('/applications/{id}/guilds/{id}/commands/{id}', 'guild'),
+]
+
+
+def compile_template(template: str) -> re.Pattern:
+    pattern = re.escape(template).replace(re.escape('{id}'), r'(\d+)').replace(re.escape('{token}'), r'([^/]+)')
+    return re.compile('^' + pattern + '$')
+
+
+def major_value(major: Union[str, None], groups: tuple) -> Union[str, None]:
+    if not major or not groups:
+        return None
+    # Webhooks (and so interaction responses) are limited per webhook ID and token, so every interaction gets its own
+    if major in ('webhook', 'interaction'):
+        return '/'.join(groups[:2])
+    return groups[0]
+
+
+compiled_templates = [(compile_template(template), template, major) for template, major in route_templates]
+discord_epoch = 1420070400000
+
+
+@dataclass
+class RateLimitConfig:
+    # Requests allowed per bucket and window (in seconds). A limit of 0 turns rate limiting off
+    limit: int = 5
+    window: float = 5.0
+    # Additionally answer every n-th request with a 429, regardless of the bucket. 0 turns this off
+    force_every: int = 0
+    retry_after: float = 1.0
+
+
+@dataclass
+class FakeUser:
+    id: int
+    name: str
+    role_ids: list[int] = field(default_factory=list)
+
+    def user_data(self, bot: bool = False) -> dict:
+        return {'id': str(self.id), 'username': self.name, 'discriminator': '0001', 'avatar': None, 'bot': bot}
+
+    def member_data(self) -> dict:
+        return {
+            'user': self.user_data(), 'roles': [str(role_id) for role_id in self.role_ids], 'nick': None,
+            'joined_at': timestamp(), 'deaf': False, 'mute': False, 'permissions': '0'
+        }
+
+
+def json_response(data: Union[dict, list], status: int = 200, headers: dict = None) -> web.Response:
+    # discord.py only decodes JSON if the content type is exactly "application/json", without a charset
+    return web.Response(body=json.dumps(data).encode(), status=status, headers={
+        **(headers or {}), 'Content-Type': 'application/json'
+    })
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeDiscord:
+    # Just enough of Discord's gateway and REST API to run the bot against: one guild, scripted events, and a count
+    # of every request the bot makes
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, rate_limits: RateLimitConfig = None):
+        self.host = host
+        self.port = port
+        self.rate_limits = rate_limits or RateLimitConfig()
+        self._snowflake_increment = 0
+        self.bot_user = FakeUser(self.snowflake(), 'FakeBot')
+        self.guild_id = self.snowflake()
+        self.roles: list[dict] = []
+        self.channels: list[dict] = []
+        self.members: dict[int, FakeUser] = {}
+        # Uploaded attachments, by file name
+        self.files: dict[str, bytes] = {}
+        # Everything the bot posted, by message ID
+        self.messages: dict[int, dict] = {}
+        self.api_calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        # Bucket -> (window start, requests in window)
+        self.buckets: dict[tuple, tuple[float, int]] = {}
+        self.request_count = 0
+        # Called with (method, route template, match groups, JSON payload, response) for every request that wasn't
+        # rate limited
+        self.listeners: list[Callable[[str, str, tuple, dict, Union[dict, list, None]], None]] = []
+        self.sockets: list[web.WebSocketResponse] = []
+        self.sequence = 0
+        self.ready = asyncio.Event()
+        self.runner: Union[web.AppRunner, None] = None
+
+    def snowflake(self) -> int:
+        self._snowflake_increment = (self._snowflake_increment + 1) % 4096
+        return (int(time.time() * 1000) - discord_epoch) << 22 | self._snowflake_increment
+
+    @property
+    def base_url(self) -> str:
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    # Setup
+
+    def add_role(self, role_id: int, name: str):
+        self.roles.append({
+            'id': str(role_id), 'name': name, 'permissions': '0', 'position': len(self.roles), 'color': 0,
+            'hoist': False, 'managed': False, 'mentionable': False
+        })
+
+    def add_channel(self, name: str) -> int:
+        channel_id = self.snowflake()
+        self.channels.append({
+            'id': str(channel_id), 'type': 0, 'name': name, 'position': len(self.channels),
+            'permission_overwrites': [], 'guild_id': str(self.guild_id), 'nsfw': False, 'topic': None
+        })
+        return channel_id
+
+    def add_member(self, name: str, role_ids: list[int] = None) -> FakeUser:
+        user = FakeUser(self.snowflake(), name, role_ids or [])
+        self.members[user.id] = user
+        return user
+
+    def guild_data(self) -> dict:
+        members = [self.bot_user.member_data()] + [user.member_data() for user in self.members.values()]
+        return {
+            'id': str(self.guild_id), 'name': 'Fake Guild', 'owner_id': str(self.bot_user.id), 'large': False,
+            'member_count': len(members), 'roles': [{
+                'id': str(self.guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0,
+                'hoist': False, 'managed': False, 'mentionable': False
+            }] + self.roles, 'channels': self.channels, 'members': members, 'emojis': [], 'features': [],
+            'presences': [], 'voice_states': [], 'unavailable': False
+        }
+
+    async def start(self):
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_get('/gateway-ws', self.handle_gateway)
+        app.router.add_get('/files/{name}', self.handle_file)
+        app.router.add_route('*', '/api/{version}/{path:.*}', self.handle_api)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for socket in self.sockets:
+            await socket.close()
+        if self.runner:
+            await self.runner.cleanup()
+
+    def point_bot_here(self):
+        # discord.py and discord_slash read these whenever they build a request
+        discord.http.Route.BASE = self.base_url + '/api/v7'
+        discord_slash.http.CustomRoute.BASE = self.base_url + '/api/v8'
+
+    # Gateway
+
+    async def handle_gateway(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets.append(socket)
+        await socket.send_str(json.dumps({'op': 10, 'd': {'heartbeat_interval': 41250}, 's': None, 't': None}))
+        async for message in socket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            data = json.loads(message.data)
+            if data['op'] == 1:
+                await socket.send_str(json.dumps({'op': 11, 'd': None, 's': None, 't': None}))
+            elif data['op'] == 2:
+                await self.dispatch('READY', {
+                    'v': 6, 'user': self.bot_user.user_data(bot=True), 'session_id': 'fake',
+                    'guilds': [{'id': str(self.guild_id), 'unavailable': True}], 'private_channels': [],
+                    'relationships': [], 'application': {'id': str(self.bot_user.id), 'flags': 0}
+                })
+                await self.dispatch('GUILD_CREATE', self.guild_data())
+                self.ready.set()
+        self.sockets.remove(socket)
+        return socket
+
+    async def dispatch(self, event: str, data: dict):
+        self.sequence += 1
+        payload = json.dumps({'op': 0, 't': event, 's': self.sequence, 'd': data})
+        for socket in self.sockets:
+            await socket.send_str(payload)
+
+    async def send_message(self, channel_id: int, author: FakeUser, content: str = '', filename: str = None,
+                           data: bytes = None) -> int:
+        message_id = self.snowflake()
+        attachments = []
+        if filename is not None:
+            self.files[filename] = data
+            attachments.append({
+                'id': str(self.snowflake()), 'filename': filename, 'size': len(data),
+                'url': '{}/files/{}'.format(self.base_url, filename),
+                'proxy_url': '{}/files/{}'.format(self.base_url, filename),
+                'content_type': 'text/plain; charset=utf-16'
+            })
+        await self.dispatch('MESSAGE_CREATE', self.message_data(
+            message_id, channel_id, author.user_data(), content=content, attachments=attachments,
+            member=author.member_data()
+        ))
+        return message_id
+
+    async def use_command(self, channel_id: int, user: FakeUser, command: str, options: list[dict] = None) -> str:
+        # Returns the interaction token, which is part of every request answering it
+        interaction_id = self.snowflake()
+        token = 'token-{}'.format(interaction_id)
+        data = {'id': str(self.snowflake()), 'name': command, 'type': 1}
+        if options:
+            data['options'] = options
+        await self.dispatch('INTERACTION_CREATE', {
+            'type': 2, 'id': str(interaction_id), 'application_id': str(self.bot_user.id), 'token': token,
+            'guild_id': str(self.guild_id), 'channel_id': str(channel_id), 'member': user.member_data(),
+            'data': data, 'version': 1
+        })
+        return token
+
+    async def press_button(self, message_id: int, user: FakeUser, label: str) -> str:
+        message = self.messages[message_id]
+        custom_id = next(
+            component['custom_id'] for row in message.get('components', []) for component in row['components']
+            if component.get('label') == label
+        )
+        interaction_id = self.snowflake()
+        token = 'token-{}'.format(interaction_id)
+        await self.dispatch('INTERACTION_CREATE', {
+            'type': 3, 'id': str(interaction_id), 'application_id': str(self.bot_user.id), 'token': token,
+            'guild_id': str(self.guild_id), 'channel_id': message['channel_id'], 'member': user.member_data(),
+            'message': message, 'data': {'custom_id': custom_id, 'component_type': 2}, 'version': 1
+        })
+        return token
+
+    def message_data(self, message_id: int, channel_id: int, author: dict, **fields) -> dict:
+        data = {
+            'id': str(message_id), 'channel_id': str(channel_id), 'guild_id': str(self.guild_id), 'author': author,
+            'content': '', 'timestamp': timestamp(), 'edited_timestamp': None, 'tts': False,
+            'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [],
+            'pinned': False, 'type': 0, 'flags': 0, 'components': []
+        }
+        data.update(fields)
+        return data
+
+    # REST
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        data = self.files.get(request.match_info['name'])
+        if data is None:
+            raise web.HTTPNotFound()
+        self.api_calls['GET /files/{name}'] += 1
+        # Like Discord's CDN, only simple "bytes=start-end" ranges are supported
+        byte_range = re.fullmatch(r'bytes=(\d+)-(\d*)', request.headers.get('Range', ''))
+        if not byte_range:
+            # Attachments are sysinfo files, everything else is a version feed
+            if request.match_info['name'].endswith('.json'):
+                return web.Response(body=data, content_type='application/json')
+            return web.Response(body=data, content_type='text/plain', charset='utf-16')
+        start = int(byte_range.group(1))
+        end = int(byte_range.group(2)) + 1 if byte_range.group(2) else len(data)
+        if start >= len(data):
+            raise web.HTTPRequestRangeNotSatisfiable()
+        return web.Response(status=206, body=data[start:end], headers={
+            'Content-Range': 'bytes {}-{}/{}'.format(start, min(end, len(data)) - 1, len(data))
+        })
+
+    def match_route(self, path: str) -> tuple[str, tuple, Union[str, None]]:
+        for pattern, template, major in compiled_templates:
+            match = pattern.match(path)
+            if match:
+                return template, match.groups(), major
+        return path, (), None
+
+    def check_rate_limit(self, method: str, template: str, groups: tuple, major: str) -> Union[float, None]:
+        # Returns how long to wait if this request is rate limited
+        self.request_count += 1
+        config = self.rate_limits
+        if config.force_every and self.request_count % config.force_every == 0:
+            return config.retry_after
+        if not config.limit:
+            return None
+        bucket = (method, template, major_value(major, groups))
+        now = time.monotonic()
+        window_start, count = self.buckets.get(bucket, (now, 0))
+        if now - window_start >= config.window:
+            window_start, count = now, 0
+        if count >= config.limit:
+            return window_start + config.window - now
+        self.buckets[bucket] = (window_start, count + 1)
+        return None
+
+    def rate_limit_headers(self, method: str, template: str, groups: tuple, major: str) -> dict:
+        config = self.rate_limits
+        if not config.limit:
+            return {}
+        bucket = (method, template, major_value(major, groups))
+        window_start, count = self.buckets.get(bucket, (time.monotonic(), 0))
+        return {
+            'X-RateLimit-Limit': str(config.limit),
+            'X-RateLimit-Remaining': str(max(0, config.limit - count)),
+            'X-RateLimit-Reset-After': '{:.3f}'.format(max(0.0, window_start + config.window - time.monotonic())),
+            'X-RateLimit-Bucket': '{}:{}'.format(template, bucket[2])
+        }
+
+    async def read_payload(self, request: web.Request) -> dict:
+        if request.content_type.startswith('multipart/'):
+            form = await request.post()
+            payload = json.loads(form.get('payload_json', '{}'))
+            payload['attachments'] = [
+                {'id': str(self.snowflake()), 'filename': value.filename, 'size': len(value.file.read()),
+                 'url': '', 'proxy_url': ''}
+                for key, value in form.items() if key.startswith('file')
+            ]
+            return payload
+        if request.can_read_body:
+            body = await request.read()
+            return json.loads(body) if body else {}
+        return {}
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        method = request.method
+        template, groups, major = self.match_route('/' + request.match_info['path'])
+        self.api_calls['{} {}'.format(method, template)] += 1
+        retry_after = self.check_rate_limit(method, template, groups, major)
+        if retry_after is not None:
+            self.rate_limited['{} {}'.format(method, template)] += 1
+            # discord.py treats a 429 without a Via header as a Cloudflare ban, and reads retry_after in milliseconds
+            return json_response(
+                {'message': 'You are being rate limited.', 'retry_after': retry_after * 1000, 'global': False},
+                status=429, headers={'Via': '1.1 google', 'Retry-After': str(retry_after)}
+            )
+        payload = await self.read_payload(request)
+        headers = self.rate_limit_headers(method, template, groups, major)
+        result = self.respond(method, template, groups, payload)
+        for listener in self.listeners:
+            listener(method, template, groups, payload, result)
+        if result is None:
+            return web.Response(status=204, headers=headers)
+        return json_response(result, headers=headers)
+
+    def respond(self, method: str, template: str, groups: tuple, payload: dict) -> Union[dict, list, None]:
+        if template in ('/gateway', '/gateway/bot'):
+            return {'url': 'ws://{}:{}/gateway-ws'.format(self.host, self.port), 'shards': 1,
+                    'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0}}
+        if template == '/users/@me':
+            return self.bot_user.user_data(bot=True)
+        if template == '/guilds/{id}/members/{id}':
+            user = self.members.get(int(groups[1]))
+            if user is None:
+                raise web.HTTPNotFound()
+            return user.member_data()
+        if template.endswith('/commands') and method == 'GET':
+            return []
+        if template.endswith('/commands') and method == 'PUT':
+            return [dict(command, id=str(self.snowflake()), application_id=str(self.bot_user.id))
+                    for command in payload]
+        if template.endswith('/commands') and method == 'POST':
+            return dict(payload, id=str(self.snowflake()), application_id=str(self.bot_user.id))
+        if template == '/channels/{id}/messages' and method == 'POST':
+            return self.store_message(int(groups[0]), payload)
+        if template == '/channels/{id}/messages/{id}' and method == 'DELETE':
+            self.messages.pop(int(groups[1]), None)
+            return None
+        if template == '/channels/{id}/messages/{id}' and method == 'PATCH':
+            message = self.messages.setdefault(int(groups[1]), self.message_data(
+                int(groups[1]), int(groups[0]), self.bot_user.user_data(bot=True)
+            ))
+            message.update(payload)
+            return message
+        if template.startswith('/webhooks/') and method in ('PATCH', 'POST'):
+            # Interaction responses. The channel doesn't matter for anything the bot does with them
+            return self.store_message(0, payload)
+        return None
+
+    def store_message(self, channel_id: int, payload: dict) -> dict:
+        message_id = self.snowflake()
+        message = self.message_data(message_id, channel_id, self.bot_user.user_data(bot=True), **{
+            key: value for key, value in payload.items()
+            if key in ('content', 'embeds', 'components', 'attachments', 'flags')
+        })
+        if channel_id:
+            self.messages[message_id] = message
+        return message
+
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from typing import Union
+
+import My24HS_Bot.bot as bot_module
+import My24HS_Bot.version_feeds as version_feeds
+from benchmarks.fake_discord import FakeDiscord, RateLimitConfig
+from benchmarks.run_benchmarks import percentile, git_revision
+from benchmarks.sysinfo_generator import GeneratorOptions, generate_sysinfo
+from My24HS_Bot.const import sysinfo_allowed_roles
+
+
+@dataclass
+class Scenario:
+    # How long commands are sent for, in seconds
+    duration: float = 60.0
+    commands_per_minute: int = 1000
+    # Sysinfo uploads come in bursts of `burst_size` files, every `burst_interval` seconds
+    bursts: int = 3
+    burst_size: int = 5
+    burst_interval: float = 15.0
+    sysinfo_size: int = 1024 * 1024
+    # Time between the prompt showing up and tech support pressing "Yes"
+    press_delay: float = 0.5
+    # How long to wait for outstanding responses once everything was sent
+    drain_timeout: float = 60.0
+    seed: int = 0
+
+
+class LoadTest:
+    def __init__(self, scenario: Scenario, rate_limits: RateLimitConfig):
+        self.scenario = scenario
+        self.random = random.Random(scenario.seed)
+        self.server = FakeDiscord(rate_limits=rate_limits)
+        self.server.listeners.append(self.on_request)
+        self.bot: Union[bot_module.My24HSbot, None] = None
+        self.commands_registered = asyncio.Event()
+        # Interaction token -> time the command was used
+        self.pending_commands: dict[str, float] = {}
+        self.command_latencies: list[float] = []
+        # Channel ID -> time the file was uploaded (every upload gets its own channel)
+        self.pending_uploads: dict[int, float] = {}
+        self.prompt_latencies: list[float] = []
+        self.result_latencies: list[float] = []
+        self.tasks: set[asyncio.Task] = set()
+        # The fake version feeds are cached here instead of next to the real ones
+        self.version_cache = tempfile.TemporaryDirectory(prefix='load-test-versions-')
+
+        self.server.add_role(sysinfo_allowed_roles[0], 'Tech Support')
+        self.helper = self.server.add_member('helper', [sysinfo_allowed_roles[0]])
+        self.command_channel = self.server.add_channel('general')
+        self.users = [self.server.add_member('user{}'.format(i)) for i in range(20)]
+        # Every upload comes from a different user in a different channel, so the bot's rate limits don't kick in
+        self.uploads = [
+            (self.server.add_channel('upload{}'.format(i)), self.server.add_member('uploader{}'.format(i)))
+            for i in range(scenario.bursts * scenario.burst_size)
+        ]
+
+    def on_request(self, method: str, template: str, groups: tuple, payload: dict, result):
+        now = time.perf_counter()
+        if template.endswith('/commands') and method == 'PUT':
+            self.commands_registered.set()
+        elif (template == '/webhooks/{id}/{token}/messages/@original' and method == 'PATCH') or (
+                template == '/interactions/{id}/{token}/callback' and payload.get('type') == 4
+        ):
+            # Commands are answered in the initial response, or by editing it if they were deferred
+            start = self.pending_commands.pop(groups[1], None)
+            if start is not None:
+                self.command_latencies.append(now - start)
+        elif template == '/channels/{id}/messages' and method == 'POST':
+            channel_id = int(groups[0])
+            if channel_id not in self.pending_uploads:
+                return
+            if payload.get('components'):
+                self.prompt_latencies.append(now - self.pending_uploads[channel_id])
+                self.spawn(self.press_yes(int(result['id'])))
+            elif payload.get('embeds'):
+                self.result_latencies.append(now - self.pending_uploads.pop(channel_id))
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def press_yes(self, message_id: int):
+        await asyncio.sleep(self.scenario.press_delay)
+        await self.server.press_button(message_id, self.helper, 'Yes')
+
+    async def start_bot(self):
+        await self.server.start()
+        self.server.point_bot_here()
+        # Nothing in here should leave the machine or end up in the real data
+        self.server.files['nvidia.json'] = json.dumps({'game_ready': {'version': '511.79'}}).encode()
+        self.server.files['amd.json'] = json.dumps({'stable': {'win_driver_version': '30.0.13025.1000'}}).encode()
+        version_feeds.nvidia_versions_url = self.server.base_url + '/files/nvidia.json'
+        version_feeds.amd_versions_url = self.server.base_url + '/files/amd.json'
+        version_feeds.windows_versions_url = ''
+        bot_module.version_cache_dir = self.version_cache.name
+        bot_module.diagnosis_db_path = ''
+        # Results from an earlier run would skip the parsing this is supposed to measure
+        bot_module.shared_cache_path = ''
+        bot_module.metrics_mode = 'off'
+        self.bot = bot_module.My24HSbot(**bot_module.client_options(), command_prefix='')
+        self.spawn(self.bot.start('fake-token'))
+        await self.bot.wait_until_ready()
+        await asyncio.wait_for(self.commands_registered.wait(), 30)
+
+    async def send_commands(self):
+        commands = sorted(self.bot.command_registry.responses)
+        count = int(self.scenario.duration * self.scenario.commands_per_minute / 60)
+        interval = self.scenario.duration / count if count else 0
+        start = time.perf_counter()
+        for i in range(count):
+            # Keep to the schedule, even if sending fell behind for a moment
+            await asyncio.sleep(max(0.0, start + i * interval - time.perf_counter()))
+            options = [{'name': 'noinline', 'type': 5, 'value': True}] if self.random.random() < 0.3 else None
+            user = self.random.choice(self.users)
+            sent = time.perf_counter()
+            token = await self.server.use_command(self.command_channel, user, self.random.choice(commands), options)
+            self.pending_commands[token] = sent
+
+    async def send_uploads(self):
+        scenario = self.scenario
+        data = generate_sysinfo(GeneratorOptions(size=scenario.sysinfo_size, gpus=2, seed=scenario.seed))
+        uploads = iter(self.uploads)
+        for burst in range(scenario.bursts):
+            if burst:
+                await asyncio.sleep(scenario.burst_interval)
+            for _ in range(scenario.burst_size):
+                channel_id, user = next(uploads)
+                self.pending_uploads[channel_id] = time.perf_counter()
+                await self.server.send_message(channel_id, user, filename='{}.txt'.format(channel_id), data=data)
+
+    async def drain(self):
+        deadline = time.perf_counter() + self.scenario.drain_timeout
+        while (self.pending_commands or self.pending_uploads) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+
+    async def run(self) -> dict:
+        await self.start_bot()
+        self.server.api_calls.clear()
+        self.server.rate_limited.clear()
+        start = time.perf_counter()
+        await asyncio.gather(self.send_commands(), self.send_uploads())
+        await self.drain()
+        elapsed = time.perf_counter() - start
+        await self.bot.close()
+        await self.server.stop()
+        self.version_cache.cleanup()
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            'revision': git_revision(),
+            'scenario': asdict(self.scenario),
+            'rate_limits': asdict(self.server.rate_limits),
+            'elapsed_s': elapsed,
+            'commands': latency_summary(self.command_latencies, len(self.pending_commands)),
+            'sysinfo_prompts': latency_summary(self.prompt_latencies, len(self.uploads) - len(self.prompt_latencies)),
+            'sysinfo_results': latency_summary(self.result_latencies, len(self.pending_uploads)),
+            'api_calls': dict(self.server.api_calls.most_common()),
+            'rate_limited': dict(self.server.rate_limited.most_common())
+        }
+
+
+def latency_summary(latencies: list[float], unanswered: int) -> dict:
+    latencies = sorted(latencies)
+    summary = {'answered': len(latencies), 'unanswered': unanswered}
+    if latencies:
+        summary.update({
+            'mean_s': sum(latencies) / len(latencies),
+            'p50_s': percentile(latencies, 50),
+            'p90_s': percentile(latencies, 90),
+            'p99_s': percentile(latencies, 99),
+            'max_s': latencies[-1]
+        })
+    return summary
+
+
+def main():
+    defaults = Scenario()
+    parser = argparse.ArgumentParser(description='Run the bot against a local fake Discord and measure it')
+    parser.add_argument('--duration', type=float, default=defaults.duration)
+    parser.add_argument('--commands-per-minute', type=int, default=defaults.commands_per_minute)
+    parser.add_argument('--bursts', type=int, default=defaults.bursts)
+    parser.add_argument('--burst-size', type=int, default=defaults.burst_size)
+    parser.add_argument('--burst-interval', type=float, default=defaults.burst_interval)
+    parser.add_argument('--sysinfo-size', type=int, default=defaults.sysinfo_size, help='In bytes')
+    parser.add_argument('--press-delay', type=float, default=defaults.press_delay)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--rate-limit', type=int, default=5, help='Requests per bucket and window, 0 to disable')
+    parser.add_argument('--rate-limit-window', type=float, default=5.0)
+    parser.add_argument('--force-429-every', type=int, default=0, help='Answer every n-th request with a 429')
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--output', help='Write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    scenario = Scenario(
+        duration=args.duration, commands_per_minute=args.commands_per_minute, bursts=args.bursts,
+        burst_size=args.burst_size, burst_interval=args.burst_interval, sysinfo_size=args.sysinfo_size,
+        press_delay=args.press_delay, seed=args.seed
+    )
+    rate_limits = RateLimitConfig(args.rate_limit, args.rate_limit_window, args.force_429_every, args.retry_after)
+    results = json.dumps(asyncio.run(LoadTest(scenario, rate_limits).run()), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='[%(asctime)s] [%(name)s/%(levelname)s] %(message)s')
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from io import BytesIO, StringIO
+from typing import Callable
+
+from benchmarks.sysinfo_generator import GeneratorOptions, generate_sysinfo
+from My24HS_Bot.command_registry import CommandRegistry
+from My24HS_Bot.const import sysinfo_header_size
+from My24HS_Bot.util import convert_utf16_utf8, handle_sysinfo, is_sysinfo, SysinfoTranscoder
+from My24HS_Bot.version_feeds import VersionTables
+
+default_sizes = [100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024]
+# Fixed tables, so results don't depend on what the latest drivers currently are
+benchmark_tables = VersionTables(
+    nvidia={'game_ready': '511.79', 'studio': '511.65', 'professional': '511.09'},
+    amd={'stable': '30.0.13025.1000'}
+)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def measure(
+        name: str, func: Callable[[], object], iterations: int, size: int = None, throughput: bool = True
+) -> dict:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    # Measured separately, since tracing allocations slows everything down quite a bit
+    tracemalloc.start()
+    func()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean = sum(timings) / len(timings)
+    result = {
+        'benchmark': name,
+        'size': size,
+        'iterations': iterations,
+        'mean_s': mean,
+        'p50_s': percentile(timings, 50),
+        'p90_s': percentile(timings, 90),
+        'p99_s': percentile(timings, 99),
+        'peak_memory_bytes': peak_memory
+    }
+    if size and throughput:
+        result['throughput_mb_s'] = size / mean / 1024 / 1024
+    return result
+
+
+def bench_sysinfo(size: int, iterations: int, seed: int) -> list[dict]:
+    data = generate_sysinfo(GeneratorOptions(size=size, gpus=2, seed=seed))
+    utf8 = convert_utf16_utf8(BytesIO(data)).getvalue()
+
+    def detect():
+        # What on_message does before deciding to download the rest of the file
+        transcoder = SysinfoTranscoder()
+        transcoder.feed(data[:sysinfo_header_size])
+        return is_sysinfo(StringIO(transcoder.header))
+
+    return [
+        measure('convert_utf16_utf8', lambda: convert_utf16_utf8(BytesIO(data)), iterations, len(data)),
+        measure('is_sysinfo', detect, iterations, len(data), throughput=False),
+        measure('handle_sysinfo', lambda: handle_sysinfo(BytesIO(utf8), benchmark_tables), iterations, len(data))
+    ]
+
+
+def bench_commands(iterations: int) -> list[dict]:
+    registry = CommandRegistry()
+    registry.read_commands()
+
+    def render_all():
+        for command in registry.responses:
+            for noinline in (False, True):
+                _, _, files = registry.render(command, noinline)
+                for file in files:
+                    file.close()
+
+    # Load all attachments first, otherwise the first iteration is mostly disk reads
+    render_all()
+    result = measure('get_command_resp', render_all, iterations)
+    result['commands'] = len(registry)
+    return [result]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sysinfo parsing and command responses')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='File sizes in bytes')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print('Benchmarking {} byte sysinfo file'.format(size), file=sys.stderr)
+        results += bench_sysinfo(size, args.iterations, args.seed)
+    print('Benchmarking command responses', file=sys.stderr)
+    results += bench_commands(args.iterations)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import random
+from dataclasses import dataclass
+
+# Builds realistic msinfo32 exports for benchmarking. Everything is derived from the seed, so the same options
+# always produce the same file
+
+windows_builds = {
+    10: [(19041, '10.0.19041'), (19042, '10.0.19042'), (19043, '10.0.19043'), (19044, '10.0.19044')],
+    11: [(22000, '10.0.22000')]
+}
+gpu_models = [
+    ('NVIDIA GeForce GTX 1060 6GB', '30.0.15.1179'),
+    ('NVIDIA GeForce RTX 3080', '30.0.15.1165'),
+    ('NVIDIA Quadro P2000', '30.0.15.1109'),
+    ('AMD Radeon RX 580 Series', '30.0.13025.1000'),
+    ('AMD Radeon RX 6800 XT', '30.0.14011.3017'),
+    ('Intel(R) UHD Graphics 630', '27.20.100.9316')
+]
+# Sections between [System Summary] and [Display], in the order msinfo32 writes them
+resource_sections = ['Hardware Resources', 'Conflicts/Sharing', 'DMA', 'Forced Hardware', 'I/O', 'IRQs']
+component_sections = ['Components', 'Multimedia', 'Audio Codecs', 'Video Codecs', 'CD-ROM', 'Sound Device']
+# Sections after [Display], these get padded until the file reaches the requested size
+trailing_sections = ['Software Environment', 'System Drivers', 'Environment Variables', 'Services', 'Startup Programs']
+
+
+@dataclass
+class GeneratorOptions:
+    size: int = 1024 * 1024
+    gpus: int = 1
+    windows: int = 10
+    # Use ',' as the decimal separator, like in most European locales
+    comma_decimals: bool = False
+    # Leave out the BaseBoard lines in [System Summary], like some OEM systems do
+    missing_baseboard: bool = False
+    seed: int = 0
+
+
+def summary_rows(options: GeneratorOptions, rng: random.Random) -> list[tuple[str, str]]:
+    build, version = rng.choice(windows_builds[options.windows])
+    decimal = ',' if options.comma_decimals else '.'
+    ram = rng.choice([4, 8, 16, 32, 64])
+    rows = [
+        ('OS Name', 'Microsoft Windows {} Pro'.format(options.windows)),
+        ('Version', '{} Build {}'.format(version, build)),
+        ('Other OS Description ', 'Not Available'),
+        ('OS Manufacturer', 'Microsoft Corporation'),
+        ('System Name', 'DESKTOP-{:07X}'.format(rng.getrandbits(28))),
+        ('System Manufacturer', rng.choice(['System manufacturer', 'Dell Inc.', 'To Be Filled By O.E.M.'])),
+        ('System Model', rng.choice(['System Product Name', 'XPS 15 9500', 'To Be Filled By O.E.M.'])),
+        ('System Type', 'x64-based PC'),
+        ('System SKU', 'SKU'),
+        ('Processor', 'AMD Ryzen 7 3700X 8-Core Processor, 3600 Mhz, 8 Core(s), 16 Logical Processor(s)'),
+        ('BIOS Version/Date', 'American Megatrends Inc. {}, 08.09.2021'.format(rng.randint(1000, 5000))),
+        ('SMBIOS Version', '3.2'),
+        ('Embedded Controller Version', '255.255'),
+        ('BIOS Mode', 'UEFI')
+    ]
+    if not options.missing_baseboard:
+        rows += [
+            ('BaseBoard Manufacturer', 'ASUSTeK COMPUTER INC.'),
+            ('BaseBoard Product', 'ROG STRIX B450-F GAMING'),
+            ('BaseBoard Version', 'Rev X.0x')
+        ]
+    rows += [
+        ('Platform Role', 'Desktop'),
+        ('Secure Boot State', 'Off'),
+        ('PCR7 Configuration', 'Elevation Required to View'),
+        ('Windows Directory', 'C:\\WINDOWS'),
+        ('System Directory', 'C:\\WINDOWS\\system32'),
+        ('Boot Device', '\\Device\\HarddiskVolume1'),
+        ('Locale', 'United States'),
+        ('Hardware Abstraction Layer', 'Version = "10.0.19041.1151"'),
+        ('User Name', 'DESKTOP\\user'),
+        ('Time Zone', 'W. Europe Daylight Time'),
+        ('Installed Physical Memory (RAM)', '{}{}0 GB'.format(ram, decimal)),
+        ('Total Physical Memory', '{}{}9 GB'.format(ram - 1, decimal)),
+        ('Available Physical Memory', '{}{}00 GB'.format(ram // 2, decimal)),
+        ('Total Virtual Memory', '{}{}3 GB'.format(ram + 2, decimal)),
+        ('Available Virtual Memory', '{}{}5 GB'.format(ram // 2, decimal)),
+        ('Page File Space', '2{}38 GB'.format(decimal)),
+        ('Page File', 'C:\\pagefile.sys'),
+        ('Kernel DMA Protection', 'Off'),
+        ('Virtualization-based security', 'Not enabled'),
+        ('Device Encryption Support', 'Reasons for failed automatic device encryption: {}'.format(rng.choice([
+            'PCR7 binding is not supported, Hardware Security Test Interface failed',
+            'TPM is not usable, PCR7 binding is not supported'
+        ]))),
+        ('Hyper-V - VM Monitor Mode Extensions', 'Yes')
+    ]
+    return rows
+
+
+def generate_sysinfo_text(options: GeneratorOptions) -> str:
+    rng = random.Random(options.seed)
+    lines = ['System Information report written at: 10/16/22 12:00:00', 'System Name: DESKTOP', '[System Summary]', '',
+             'Item\tValue\t']
+    lines += ['{}\t{}\t'.format(key, value) for key, value in summary_rows(options, rng)]
+    lines.append('')
+
+    for section in resource_sections:
+        lines += ['[{}]'.format(section), '', 'Resource\tDevice\tStatus\t', '0x{:X}\tPCI Bus\tOK\t'.format(
+            rng.getrandbits(16)
+        ), '']
+    lines += ['[Memory]', '', 'Resource\tDevice\tStatus\t', '0xA0000-0xBFFFF\tPCI Express Root Complex\tOK\t',
+              '0xFED40000-0xFED44FFF\tTrusted Platform Module 2.0\tOK\t', '']
+    for section in component_sections:
+        lines += ['[{}]'.format(section), '', 'Item\tValue\t', 'Name\tGeneric Device\t', '']
+
+    lines += ['[Display]', '', 'Item\tValue\t']
+    for i in range(options.gpus):
+        if i:
+            lines.append('\t\t')
+        name, version = gpu_models[rng.randrange(len(gpu_models))]
+        lines += [
+            'Name\t{}\t'.format(name),
+            'PNP Device ID\tPCI\\VEN_10DE&DEV_{:04X}\t'.format(rng.getrandbits(16)),
+            'Adapter Type\t{}, NVIDIA compatible\t'.format(name),
+            'Adapter Description\t{}\t'.format(name),
+            'Adapter RAM\t{} bytes\t'.format(rng.choice([4, 6, 8]) * 1024 ** 3),
+            'Installed Drivers\tC:\\WINDOWS\\System32\\DriverStore\\FileRepository\\driver.dll\t',
+            'Driver Version\t{}\t'.format(version),
+            'INF File\toem{}.inf (Section001 section)\t'.format(rng.randint(1, 99))
+        ]
+    lines.append('')
+
+    # Every line ends up as 2 bytes per character (+ CRLF) in UTF-16
+    size = sum(len(line) + 2 for line in lines) * 2
+    section_index = 0
+    while size < options.size:
+        section = trailing_sections[section_index % len(trailing_sections)]
+        lines += ['[{}]'.format(section), '', 'Name\tDescription\tFile\tType\tStarted\tStart Mode\tState\t']
+        for row in range(rng.randint(200, 2000)):
+            line = 'drv{0}\tDriver {0}\tc:\\windows\\system32\\drivers\\drv{0}.sys\tKernel Driver\t{1}\t{2}\t' \
+                   'Running\t'.format(row, rng.choice(['Yes', 'No']), rng.choice(['Auto', 'Manual', 'Boot']))
+            lines.append(line)
+            size += (len(line) + 2) * 2
+            if size >= options.size:
+                break
+        lines.append('')
+        section_index += 1
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def generate_sysinfo(options: GeneratorOptions) -> bytes:
+    # msinfo32 always writes UTF-16 with a BOM
+    return generate_sysinfo_text(options).encode('utf-16')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic msinfo32 export')
+    parser.add_argument('output')
+    parser.add_argument('--size', type=int, default=GeneratorOptions.size, help='Minimum file size in bytes')
+    parser.add_argument('--gpus', type=int, default=GeneratorOptions.gpus)
+    parser.add_argument('--windows', type=int, choices=windows_builds.keys(), default=GeneratorOptions.windows)
+    parser.add_argument('--comma-decimals', action='store_true')
+    parser.add_argument('--missing-baseboard', action='store_true')
+    parser.add_argument('--seed', type=int, default=GeneratorOptions.seed)
+    args = parser.parse_args()
+    options = GeneratorOptions(
+        size=args.size, gpus=args.gpus, windows=args.windows, comma_decimals=args.comma_decimals,
+        missing_baseboard=args.missing_baseboard, seed=args.seed
+    )
+    with open(args.output, 'wb') as f:
+        f.write(generate_sysinfo(options))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,126 @@
-import discord
+import argparse
 import logging
+import multiprocessing
+import time
 
-from My24HS_Bot.bot import My24HSbot
-from My24HS_Bot.const import bot_token
+from My24HS_Bot.const import bot_token, shard_count, shard_workers
+from My24HS_Bot.sharding import ShardPlan, parse_shard_ids, split_shards
+from My24HS_Bot.startup import StartupTimer
 
-if __name__ == '__main__':
+# Seconds to wait before restarting a worker process that exited. Doubles with every exit in a row that happened
+# within `worker_min_uptime` seconds of starting, up to `worker_max_restart_delay`
+worker_restart_delay = 10
+worker_max_restart_delay = 5 * 60
+worker_min_uptime = 60
+# A worker that exits this many times in a row that quickly (a bad token or config, most likely) isn't restarted again
+worker_max_quick_exits = 5
+
+
+def setup_logging(name: str = None):
     logging.basicConfig(
         level=logging.INFO,
-        format='[%(asctime)s] [%(name)s/%(levelname)s] %(message)s',
+        format='[%(asctime)s] [{}%(name)s/%(levelname)s] %(message)s'.format(name + ' ' if name else ''),
         datefmt='%H:%M:%S'
     )
-    client = My24HSbot(intents=discord.Intents.all(), command_prefix='')
+
+
+def run_bot(shard_plan: ShardPlan, delay: float = 0):
+    if delay:
+        time.sleep(delay)
+    startup = StartupTimer()
+    # discord.py and everything else the bot needs is only imported here, so the worker supervisor (and --help) never
+    # have to load it
+    with startup.phase('imports'):
+        from My24HS_Bot.bot import create_bot, client_options
+    with startup.phase('setup'):
+        client = create_bot(shard_plan, startup=startup, **client_options(), command_prefix='')
     client.run(bot_token)
+
+
+def run_worker(shard_plan: ShardPlan, delay: float):
+    # Entry point of the worker processes
+    setup_logging(shard_plan.name)
+    run_bot(shard_plan, delay)
+
+
+def run_workers(count: int, workers: int):
+    # One process per range of shards. They share nothing but the files on disk (commands, caches, databases)
+    plans = [
+        ShardPlan(sharded=True, shard_count=count, shard_ids=shard_ids) for shard_ids in split_shards(count, workers)
+    ]
+    context = multiprocessing.get_context('spawn')
+    processes: dict[ShardPlan, multiprocessing.Process] = {}
+    # When each worker was started (including its delay), and how many times in a row it exited soon after that
+    started: dict[ShardPlan, float] = {}
+    quick_exits: dict[ShardPlan, int] = {plan: 0 for plan in plans}
+
+    def start(plan: ShardPlan, delay: float):
+        process = context.Process(target=run_worker, args=(plan, delay), name=plan.name)
+        process.start()
+        processes[plan] = process
+        started[plan] = time.monotonic() + delay
+
+    for plan in plans:
+        start(plan, plan.startup_delay())
+    try:
+        while processes:
+            time.sleep(1)
+            for plan, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                del processes[plan]
+                if time.monotonic() - started[plan] < worker_min_uptime:
+                    quick_exits[plan] += 1
+                else:
+                    quick_exits[plan] = 0
+                if quick_exits[plan] >= worker_max_quick_exits:
+                    logging.error('Worker {} exited with code {}, {} times in a row right after starting. Giving up on '
+                                  'it'.format(plan.name, process.exitcode, quick_exits[plan]))
+                    continue
+                delay = min(worker_restart_delay * 2 ** max(quick_exits[plan] - 1, 0), worker_max_restart_delay)
+                logging.warning('Worker {} exited with code {}, restarting it in {} seconds'.format(
+                    plan.name, process.exitcode, delay
+                ))
+                start(plan, delay)
+        logging.error('All workers gave up')
+        raise SystemExit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the 24HS bot')
+    parser.add_argument('--shards', type=int, default=shard_count,
+                        help='Total number of shards, 0 for as many as Discord recommends. Not sharded by default')
+    parser.add_argument('--workers', type=int, default=shard_workers,
+                        help='Split the shards up between this many processes')
+    parser.add_argument('--shard-ids', type=parse_shard_ids,
+                        help='Only run these shards ("4-7" or "4,5,6,7") in this process, e.g. to spread them over '
+                             'several machines')
+    args = parser.parse_args()
+
+    if args.shards is None:
+        if args.workers > 1 or args.shard_ids:
+            parser.error('--workers and --shard-ids need --shards')
+        setup_logging()
+        run_bot(ShardPlan())
+    elif args.workers > 1:
+        if not args.shards or args.shard_ids:
+            parser.error('--workers needs an explicit shard count and can\'t be combined with --shard-ids')
+        setup_logging('supervisor')
+        run_workers(args.shards, args.workers)
+    else:
+        if args.shard_ids and (not args.shards or args.shard_ids[-1] >= args.shards):
+            parser.error('--shard-ids have to be below --shards')
+        plan = ShardPlan(sharded=True, shard_count=args.shards or None, shard_ids=args.shard_ids)
+        setup_logging(plan.name if args.shard_ids else None)
+        run_bot(plan, delay=plan.startup_delay() if args.shard_ids else 0)
+
+
+if __name__ == '__main__':
+    main()